@@ -1,9 +1,10 @@
 from typing import Optional, List
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, model_validator
 from pydantic.json_schema import SkipJsonSchema
 from datetime import datetime
 
 from .utils import field_with_meta
+from .interning import intern_model
 
 # document_only to mark child collections to be excluded from schema, but not autodoc
 # exclude=True to include in redcap, but exclude from documentation
@@ -14,17 +15,29 @@ from .utils import field_with_meta
 # Felles kode-/verdi-struktur
 # ============================================================
 
+# Like kodeverdier deles når interning er slått på; de delte instansene er uforanderlige (se interning.py)
+
 class Code(BaseModel):
     """Basemodell for kodeverdi-par, som brukes mange steder i datamodellen. Inneholder både kodeverdi, vist verdi og terminologi."""
     v: Optional[str] = field_with_meta(title="Kode")
     dn: Optional[str] = field_with_meta(title="Vist verdi")
     term: Optional[str] = field_with_meta(title="Terminologi")
 
+    @model_validator(mode="wrap")
+    @classmethod
+    def _interned(cls, value, handler):
+        return intern_model(cls, value, handler)
+
 class CodeValue(BaseModel):
     """Basemodell for kodeverdi-par med tilhørende målt verdi og enhet, som brukes mange steder i datamodellen."""
     magnitude: Optional[float] = field_with_meta(title="Målt verdi")
     unit: Optional[str] = field_with_meta(title="Enhet")
 
+    @model_validator(mode="wrap")
+    @classmethod
+    def _interned(cls, value, handler):
+        return intern_model(cls, value, handler)
+
 class CodeValueBoth(BaseModel):
     """Basemodell for kodeverdi-par med tilhørende målt verdi og enhet, samt kodeverdi/vist verdi og terminologi. Brukes enkelte steder i datamodellen."""
     v: Optional[str] = field_with_meta(title="Kode")
@@ -33,6 +46,11 @@ class CodeValueBoth(BaseModel):
     magnitude: Optional[float] = field_with_meta(title="Målt verdi")
     unit: Optional[str] = field_with_meta(title="Enhet")
 
+    @model_validator(mode="wrap")
+    @classmethod
+    def _interned(cls, value, handler):
+        return intern_model(cls, value, handler)
+
 # ============================================================
 # Admin
 # ============================================================
@@ -148,7 +166,6 @@ class Clinic(BaseModel):
     cln_multi_prim_basis: Optional[Code] = field_with_meta(title="Multiple primære (grunnlag)")
 
     # child collections
-    """
     comorbidities: List["Comorbidity"] = Field(default_factory=list, exclude=True, alias="Comorbidity-tabell", document_only=True)
     prev_cancers: List["PrevCancer"] = Field(default_factory=list, exclude=True, alias="PrevCancer-tabell", document_only=True)
     prev_treatments: List["PrevTreatment"] = Field(default_factory=list, exclude=True, alias="PrevTreatment-tabell", document_only=True)
@@ -161,7 +178,6 @@ class Clinic(BaseModel):
     lab_samples: List["LabSample"] = Field(default_factory=list, exclude=True, alias="LabSample-tabell", document_only=True)
     lab_tests: List["LabTest"] = Field(default_factory=list, exclude=True, alias="LabTest-tabell", document_only=True)
     treatment_summaries: List["TreatmentSummary"] = Field(default_factory=list, exclude=True, alias="TreatmentSummary-tabell", document_only=True)
-    """
 
 # ============================================================
 # Studies
@@ -297,9 +313,7 @@ class Mets(BaseModel):
     mets_side: Optional[Code] = field_with_meta(title="Kroppsside")
     mets_other_meth: Optional[str] = field_with_meta(title="Annen metode")
 
-    """
     methods: List["MetsMethod"] = Field(default_factory=list, exclude=True, alias="MetsMethod-tabell", document_only=True)
-    """
 
 
 class LymphMets(BaseModel):
@@ -314,9 +328,7 @@ class LymphMets(BaseModel):
     lmets_side: Optional[Code] = field_with_meta(title="Kroppsside")
     lmets_other_meth: Optional[str] = field_with_meta(title="Annen metode")
 
-    """
     methods: List["MetsMethod"] = Field(default_factory=list, exclude=True, alias="MetsMethod-tabell", document_only=True)
-    """
 
 
 class MetsMethod(BaseModel):
@@ -423,8 +435,6 @@ class TreatmentSummary(BaseModel):
     txsum_med_summary_txt: Optional[str] = field_with_meta(title="Overordnet beskrivelse av medikamentell behandling")
     txsum_rt_summary_txt: Optional[str] = field_with_meta(title="Overordnet beskrivelse av strålebehandling")
 
-    """
     surgeries: List["TreatmentSurgery"] = Field(default_factory=list, exclude=True, alias="TreatmentSurgery-tabell", document_only=True)
     medicines: List["TreatmentMedicine"] = Field(default_factory=list, exclude=True, alias="TreatmentMedicine-tabell", document_only=True)
-    radiotherapy: List["TreatmentRT"] = Field(default_factory=list, exclude=True, alias="TreatmentRT-tabell", document_only=True)
-    """
\ No newline at end of file
+    radiotherapy: List["TreatmentRT"] = Field(default_factory=list, exclude=True, alias="TreatmentRT-tabell", document_only=True)
\ No newline at end of file
@@ -1,8 +1,9 @@
 from typing_extensions import Annotated
 
-from pydantic import BaseModel, PlainSerializer, BeforeValidator, Field
-from typing import Optional, List, Literal
+from pydantic import BaseModel, PlainSerializer, BeforeValidator, Field, WithJsonSchema
+from typing import Optional, List, Literal, Tuple
 from datetime import datetime
+import re
 
 from .utils import field_with_meta
 
@@ -32,6 +33,31 @@ DICOMTime = Annotated[
 	PlainSerializer(dicom_time_serializer)
 ]
 
+VECTOR_NUMBER = re.compile(r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?")
+
+def vector3_parser(v) -> Tuple[float, float, float]:
+	"""Tolker 3-vektorer lagret som tekst ("[x, y, z]", "(x, y, z)", "x,y,z", DICOM "x\\y\\z") eller sekvens."""
+	if isinstance(v, str):
+		v = VECTOR_NUMBER.findall(v)
+	values = tuple(float(x) for x in v)
+	if len(values) != 3:
+		raise ValueError(f"Forventet tre koordinater, fikk {len(values)}")
+	return values
+
+def vector3_serializer(v: Tuple[float, float, float]) -> str:
+	return "[" + ", ".join(repr(float(x)) for x in v) + "]"
+
+# Skjemaet viser både tekstformen (som før) og tre tall, siden begge godtas ved innlesing
+Vector3 = Annotated[
+	Tuple[float, float, float],
+	BeforeValidator(vector3_parser),
+	PlainSerializer(vector3_serializer, return_type=str),
+	WithJsonSchema({"anyOf": [
+		{"type": "string"},
+		{"type": "array", "items": {"type": "number"}, "minItems": 3, "maxItems": 3}
+	]}, mode="validation")
+]
+
 roi_types = ("EXTERNAL", "PTV", "CTV", "GTV", "TREATED_VOLUME", "IRRAD_VOLUME","OAR", "BOLUS", "AVOIDANCE", "ORGAN",
 			"MARKER", "REGISTRATION", "ISOCENTER", "CONTRAST_AGENT", "CAVITY", "BRACHY_CHANNEL", "BRACHY_ACCESSORY", 
 			"BRACHY_SRC_APP", "SUPPORT", "FIXATION", "DOSE_REGION", "CONTROL", "DOSE_MEASUREMENT")
@@ -225,7 +251,7 @@ class DVH(BaseModel):
 					"Den er beregnet som levert dose til primært normeringsvolum / planlagt dose til primært normeringsvolum")
 	surface_area: Optional[float] = field_with_meta(title='ROI surface area [cm2]', description='Overflatearealet til strukturen', unit='cm2')
 	ptv_overlap: Optional[float] = field_with_meta(title='PTV overlap [cm3]', description='Volum for overlapp mellom aktuell struktur og (union) PTV', unit="cm3")
-	centroid: Optional[str] = field_with_meta(title='ROI centroid [cm,cm,cm]', description='Sentroiden til aktuell struktur', unit="[cm,cm,cm]")
+	centroid: Optional[Vector3] = field_with_meta(title='ROI centroid [cm,cm,cm]', description='Sentroiden til aktuell struktur', unit="[cm,cm,cm]")
 	dist_to_ptv_centroids: Optional[float] = field_with_meta(title='Distance to PTV centroid [cm]', description='Avstand mellom sentroider for aktuell struktur og (union) PTV. Beregnet med ``shapely``', unit="cm")
 	spread_x: Optional[float] = field_with_meta(title='Spread in X [cm]', description='Størrese i X-retning på rektangulær prisme som dekker aktuell struktur. Beregnet med ``shapely``', unit="cm")
 	spread_y: Optional[float] = field_with_meta(title='Spread in Y [cm]', description='Størrese i Y-retning på rektangulær prisme som dekker aktuell struktur. Beregnet med ``shapely``', unit="cm")
@@ -342,7 +368,7 @@ class Beam(BaseModel):
 	couch_min: Optional[float] = field_with_meta(title='Cough min [deg]', description='Største bordvinkel', unit="deg", dicom='(300A, 0122)')
 	couch_max: Optional[float] = field_with_meta(title='Cough max [deg]', description='Minste bordvinkel', unit="deg", dicom='(300A, 0122)')
 	beam_dose_pt: Optional[str] = field_with_meta(title='Beam dose Specification point [Gy]', description='Dose til primært normeringsvolum for dette feltet', unit='Gy', dicom='(300A, 0082)')
-	isocenter: Optional[str] = field_with_meta(title='Isocenter position', description='Isosenterposisjon i x,y,z', unit="[cm, cm, cm]", dicom='(300A, 012C)')
+	isocenter: Optional[Vector3] = field_with_meta(title='Isocenter position', description='Isosenterposisjon i x,y,z', unit="[cm, cm, cm]", dicom='(300A, 012C)')
 	ssd: Optional[float] = field_with_meta(title='Source to surface distance', description='Avstand mellom kilde og overflate. Dersom behandlingsmodalitetet er ARC, beregnes gjennomsnittet.', unit="cm", dicom='(300A, 0130)')
 	treatment_machine: Optional[str] = field_with_meta(title='Treatment machine name', description='(Lokalt) navn på behandlingsapparat', dicom='(300A, 00B2)')
 	
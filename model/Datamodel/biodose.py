@@ -0,0 +1,107 @@
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from .Strukturer import Plan
+from .dvh import BIN_WIDTH, dvh_matrix, dvh_metrics, metric_rows
+
+# α/β [Gy] når strukturen ikke finnes i tabellen: målvolum 10 Gy, øvrige 3 Gy
+TARGET_TYPES = ("PTV", "CTV", "GTV")
+DEFAULT_TARGET_ALPHA_BETA = 10.0
+DEFAULT_ALPHA_BETA = 3.0
+
+ArrayLike = Union[float, Sequence[float], np.ndarray]
+
+
+def eqd2(dose: ArrayLike, fractions: ArrayLike, alpha_beta: ArrayLike) -> np.ndarray:
+    """EQD2 = D (d + α/β) / (2 + α/β), der d = D / n er dose per fraksjon."""
+    dose, fractions, alpha_beta = (np.asarray(v, dtype=float) for v in (dose, fractions, alpha_beta))
+    return dose * (dose / fractions + alpha_beta) / (2 + alpha_beta)
+
+
+def bed(dose: ArrayLike, fractions: ArrayLike, alpha_beta: ArrayLike) -> np.ndarray:
+    """BED = D (1 + d / (α/β)), der d = D / n er dose per fraksjon."""
+    dose, fractions, alpha_beta = (np.asarray(v, dtype=float) for v in (dose, fractions, alpha_beta))
+    return dose * (1 + dose / (fractions * alpha_beta))
+
+
+def _physical(converted: np.ndarray, fractions: np.ndarray, alpha_beta: np.ndarray, kind: str) -> np.ndarray:
+    """Fysisk totaldose som gir ``converted`` (positiv rot av andregradslikningen)."""
+    if kind == "EQD2":
+        return fractions / 2 * (-alpha_beta + np.sqrt(alpha_beta ** 2 + 4 * converted * (2 + alpha_beta) / fractions))
+    return fractions * alpha_beta / 2 * (-1 + np.sqrt(1 + 4 * converted / (fractions * alpha_beta)))
+
+
+def alpha_beta_for(
+        names: Sequence[str],
+        types: Optional[Sequence[str]] = None,
+        table: Optional[Dict[str, float]] = None
+    ) -> np.ndarray:
+    """α/β per struktur: fra ``table`` (strukturnavn eller -type, uten hensyn til store/små bokstaver),
+    ellers standardverdi etter strukturtype."""
+    table = {k.upper(): v for k, v in (table or {}).items()}
+    types = types or [""] * len(names)
+    out = []
+    for name, kind in zip(names, types):
+        kind = (kind or "").upper()
+        value = table.get(name.upper(), table.get(kind))
+        if value is None:
+            value = DEFAULT_TARGET_ALPHA_BETA if kind in TARGET_TYPES else DEFAULT_ALPHA_BETA
+        out.append(value)
+    return np.array(out, dtype=float)
+
+
+def convert_dvhs(
+        cumulative: np.ndarray,
+        fractions: ArrayLike,
+        alpha_beta: ArrayLike,
+        kind: str = "EQD2",
+        bin_width: float = BIN_WIDTH
+    ) -> np.ndarray:
+    """Konverterer kumulative DVH-er (S, B) til EQD2 eller BED på samme doseakse, for alle strukturer samtidig
+
+    Volumaksen er uendret; for hver binkant på den nye aksen regnes tilsvarende fysisk dose ut analytisk
+    (invers av EQD2/BED), og volumet interpoleres der. ``fractions`` og ``alpha_beta`` er skalarer eller én
+    verdi per struktur."""
+    if kind not in ("EQD2", "BED"):
+        raise ValueError(f"Ukjent konvertering: {kind}")
+    s, b = cumulative.shape
+    fractions = np.broadcast_to(np.asarray(fractions, dtype=float), (s,))[:, None]
+    alpha_beta = np.broadcast_to(np.asarray(alpha_beta, dtype=float), (s,))[:, None]
+
+    convert = eqd2 if kind == "EQD2" else bed
+    top = float(np.nanmax(convert(b * bin_width, fractions, alpha_beta))) if s else 0.0
+    bins = int(np.ceil(top / bin_width)) + 1
+    target = np.arange(bins)[None, :] * bin_width
+
+    position = _physical(target, fractions, alpha_beta, kind) / bin_width
+    position = np.clip(position, 0, b - 1)
+    k = np.minimum(np.floor(position).astype(np.int64), b - 2) if b > 1 else np.zeros_like(position, dtype=np.int64)
+    t = position - k
+    here = np.take_along_axis(cumulative, k, axis=1)
+    after = np.take_along_axis(cumulative, np.minimum(k + 1, b - 1), axis=1)
+    return here * (1 - t) + after * t
+
+
+def plan_metrics(
+        plan: Plan,
+        fractions: ArrayLike,
+        kind: str = "EQD2",
+        table: Optional[Dict[str, float]] = None,
+        prescription: Optional[float] = None,
+        bin_width: float = BIN_WIDTH
+    ) -> Tuple[List[dict], np.ndarray]:
+    """``RT.DVH``-metrikker i EQD2/BED for alle strukturer i en ``Strukturer.Plan``
+
+    ``fractions`` er ``RT.Plan.fxs_planned``, eller én verdi per struktur som i ``convert_dvhs``.
+    ``prescription`` (for ``v95``) må oppgis i samme enhet som ``kind``. Gir radene (kun ``RT.DVH``-felt og
+    ``roi_name``) og α/β brukt per struktur."""
+    cumulative = dvh_matrix(plan.dvh_doses_gy_nested, plan.dvh_relative_volumes_nested, bin_width)
+    alpha_beta = alpha_beta_for(plan.structure_names, plan.structure_types, table)
+    converted = convert_dvhs(cumulative, fractions, alpha_beta, kind, bin_width)
+    volumes = np.array(plan.structure_volumes, dtype=float) if plan.structure_volumes else None
+    presc = None if prescription is None else np.full(len(converted), prescription)
+    rows = metric_rows(dvh_metrics(converted, volumes, presc, bin_width))
+    for row, name in zip(rows, plan.structure_names):
+        row["roi_name"] = name
+    return rows, alpha_beta
@@ -0,0 +1,145 @@
+import sqlite3
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Tuple, Type
+
+from pydantic import BaseModel
+
+from .epj_assembler import TABLES
+from .utils import content_digest, normalise_value
+
+# Felter som endres ved hver utsending av eksportskjemaet uten at innholdet er endret. ``record_id`` er
+# felles for alle rader hos pasienten (``field_with_meta`` skriver ikke ``transfer_only`` til feltet).
+VOLATILE_FIELDS = ("record_id", "sent_dt", "export_template_id")
+
+_fields: Dict[Type[BaseModel], Tuple[str, Tuple[str, ...]]] = {}
+
+
+def row_fields(model: Type[BaseModel]) -> Tuple[str, Tuple[str, ...]]:
+    """(nøkkelfelt, innholdsfelt) for en EPJ-modell.
+
+    Nøkkelen er modellens første skjulte felt (``cln_id``, ``ae_id`` osv.). Øvrige skjulte felt er
+    fremmednøkler og hører med i innholdet, slik at en rad som flyttes til en annen forelder regnes som endret.
+    ``transfer_only``/``document_only``-felt, barnesamlinger og ``VOLATILE_FIELDS`` er ikke en del av innholdet."""
+    cached = _fields.get(model)
+    if cached is None:
+        key, content = None, []
+        for name, info in model.model_fields.items():
+            extra = info.json_schema_extra if isinstance(info.json_schema_extra, dict) else {}
+            if info.exclude or extra.get("transfer_only") or extra.get("document_only") or name in VOLATILE_FIELDS:
+                continue
+            if extra.get("hidden") and key is None:
+                key = name
+                continue
+            content.append(name)
+        cached = _fields[model] = (key, tuple(sorted(content)))
+    return cached
+
+
+def _get(row, name):
+    return row.get(name) if isinstance(row, dict) else getattr(row, name, None)
+
+
+def row_digest(model: Type[BaseModel], row) -> bytes:
+    """Stabil innholdshash for en rad. Tomme felt utelates, slik at nye valgfrie felt i modellen
+    ikke endrer hashen for eksisterende rader."""
+    values = []
+    for name in row_fields(model)[1]:
+        value = normalise_value(_get(row, name))
+        if value:
+            values.extend((name, value))
+    return content_digest(values)
+
+
+@dataclass
+class ChangeSet:
+    """Endringer for én pasient: nye og endrede rader som (modell, rad), slettede som (modell, nøkkel)."""
+    record_id: str
+    inserted: List[Tuple[Type[BaseModel], object]] = field(default_factory=list)
+    updated: List[Tuple[Type[BaseModel], object]] = field(default_factory=list)
+    deleted: List[Tuple[Type[BaseModel], str]] = field(default_factory=list)
+
+    def __bool__(self):
+        return bool(self.inserted or self.updated or self.deleted)
+
+
+class ChangeDetector:
+    """Endringsdeteksjon for EPJ-eksportskjema
+       =======================================
+
+        DIPS sender hele innrapporteringsskjemaet på nytt ved hver endring. ``ChangeDetector`` holder en
+        innholdshash per rad (``record_id``, modell, nøkkel) i en SQLite-fil og sammenligner hver ny utsending
+        mot denne, slik at kun nye, endrede og slettede rader skrives videre til REDCap og databasen.
+
+        En utsending regnes som komplett: rader som lå i indeksen for pasienten, men ikke er med i
+        utsendingen, regnes som slettet. Indeksen oppdateres først når ``commit`` kalles."""
+
+    def __init__(self, path: str, models: Iterable[Type[BaseModel]] = TABLES):
+        self.models = {model.__name__: model for model in models}
+        self.db = sqlite3.connect(path)
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS row_hash (
+                record_id TEXT NOT NULL, model TEXT NOT NULL, row_key TEXT NOT NULL, digest BLOB NOT NULL,
+                PRIMARY KEY (record_id, model, row_key)
+            )
+        """)
+        self._pending: Dict[str, Dict[Tuple[str, str], bytes]] = {}
+
+    def _stored(self, record_id: str) -> Dict[Tuple[str, str], bytes]:
+        if record_id in self._pending:
+            return self._pending[record_id]
+        return {
+            (model, row_key): digest
+            for model, row_key, digest in self.db.execute(
+                "SELECT model, row_key, digest FROM row_hash WHERE record_id = ?", (record_id,)
+            )
+        }
+
+    def detect(self, record_id: str, tables: Dict[Type[BaseModel], Iterable]) -> ChangeSet:
+        """Sammenligner en komplett utsending for ``record_id`` mot hashindeksen."""
+        stored = self._stored(record_id)
+        current: Dict[Tuple[str, str], bytes] = {}
+        changes = ChangeSet(record_id)
+
+        for model, rows in tables.items():
+            key_field = row_fields(model)[0]
+            for row in rows:
+                row_key = normalise_value(_get(row, key_field)) if key_field else ""
+                digest = row_digest(model, row)
+                if not row_key:
+                    # Uten nøkkel identifiseres raden av innholdet (med løpenummer for like rader)
+                    row_key = "#" + digest.hex()
+                    n = 1
+                    while (model.__name__, row_key) in current:
+                        row_key = f"#{digest.hex()}#{n}"
+                        n += 1
+                key = (model.__name__, row_key)
+                if key in current:
+                    raise ValueError(f"Duplisert nøkkel {model.__name__}.{key_field}={row_key} for {record_id}")
+                current[key] = digest
+                previous = stored.get(key)
+                if previous is None:
+                    changes.inserted.append((model, row))
+                elif previous != digest:
+                    changes.updated.append((model, row))
+
+        for name, row_key in stored.keys() - current.keys():
+            changes.deleted.append((self.models.get(name, name), row_key))
+        changes.deleted.sort(key=lambda item: (getattr(item[0], "__name__", item[0]), item[1]))
+
+        if changes:
+            self._pending[record_id] = current
+        return changes
+
+    def commit(self):
+        """Lagrer hashindeksen for utsendingene som er behandlet siden forrige ``commit``."""
+        with self.db:
+            for record_id, current in self._pending.items():
+                self.db.execute("DELETE FROM row_hash WHERE record_id = ?", (record_id,))
+                self.db.executemany(
+                    "INSERT INTO row_hash (record_id, model, row_key, digest) VALUES (?, ?, ?, ?)",
+                    ((record_id, model, row_key, digest) for (model, row_key), digest in current.items())
+                )
+        self._pending.clear()
+
+    def close(self):
+        self.db.close()
@@ -0,0 +1,216 @@
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+STATS = ("min", "mean", "median", "max")
+
+
+def grouped_stats(values: np.ndarray, group: np.ndarray, n: int) -> Dict[str, np.ndarray]:
+    """min/mean/median/max per gruppe, vektorisert med én sortering. NaN ignoreres; tomme grupper gir NaN."""
+    finite = np.isfinite(values)
+    values, group = values[finite], group[finite]
+    order = np.lexsort((values, group))
+    values, group = values[order], group[order]
+
+    count = np.bincount(group, minlength=n)
+    starts = np.concatenate(([0], np.cumsum(count)[:-1]))
+    has = count > 0
+    last = np.maximum(starts + count - 1, 0)
+    out = {stat: np.full(n, np.nan) for stat in STATS}
+    if len(values):
+        out["min"][has] = values[starts[has]]
+        out["max"][has] = values[last[has]]
+        lo = values[np.minimum(starts + (count - 1) // 2, len(values) - 1)]
+        hi = values[np.minimum(starts + count // 2, len(values) - 1)]
+        out["median"][has] = ((lo + hi) / 2)[has]
+        out["mean"][has] = (np.bincount(group, weights=values, minlength=n) / np.maximum(count, 1))[has]
+    return out
+
+
+def apertures(
+        leaves: np.ndarray,
+        leaf_boundaries: np.ndarray,
+        jaws_x: Optional[np.ndarray] = None,
+        jaws_y: Optional[np.ndarray] = None
+    ) -> Dict[str, np.ndarray]:
+    """Areal og omkrets for åpningen i hvert kontrollpunkt
+
+    ``leaves`` har form (N, 2, L) med posisjonene til bank A og B (mm, som i DICOM LeafJawPositions),
+    ``leaf_boundaries`` har L+1 bladgrenser langs Y, og ``jaws_x``/``jaws_y`` har form (N, 2).
+
+    ``x_perim`` er lengden av kantene parallelt med X (bladsider og kjever i Y), ``y_perim`` lengden av
+    kantene parallelt med Y (bladender). Areal i cm², omkrets i cm og kompleksitet (omkrets/areal,
+    c1 = c2 = 1) i mm⁻¹."""
+
+    leaves = np.asarray(leaves, dtype=float)
+    n = leaves.shape[0]
+    a, b = leaves[:, 0, :], leaves[:, 1, :]
+    if jaws_x is not None:
+        jaws_x = np.asarray(jaws_x, dtype=float)
+        a = np.maximum(a, jaws_x[:, :1])
+        b = np.minimum(b, jaws_x[:, 1:])
+    width = np.clip(b - a, 0, None)
+
+    bounds = np.asarray(leaf_boundaries, dtype=float)
+    top, bottom = np.broadcast_to(bounds[:-1], width.shape), np.broadcast_to(bounds[1:], width.shape)
+    if jaws_y is not None:
+        jaws_y = np.asarray(jaws_y, dtype=float)
+        top = np.maximum(top, jaws_y[:, :1])
+        bottom = np.minimum(bottom, jaws_y[:, 1:])
+    height = np.clip(bottom - top, 0, None)
+    width = np.where(height > 0, width, 0.0)
+    a = np.where(width > 0, a, 0.0)
+    b = np.where(width > 0, b, 0.0)
+
+    area = (width * height).sum(axis=1)
+
+    # Kanter mellom nabobladpar: symmetrisk differanse av åpningene, med lukkede rader i hver ende
+    pad = np.zeros((n, 1))
+    a, b, width = np.hstack((pad, a, pad)), np.hstack((pad, b, pad)), np.hstack((pad, width, pad))
+    overlap = np.clip(np.minimum(b[:, 1:], b[:, :-1]) - np.maximum(a[:, 1:], a[:, :-1]), 0, None)
+    x_perim = (width[:, 1:] + width[:, :-1] - 2 * overlap).sum(axis=1)
+    y_perim = 2 * np.where(width[:, 1:-1] > 0, height, 0.0).sum(axis=1)
+
+    perim = x_perim + y_perim
+    with np.errstate(divide="ignore", invalid="ignore"):
+        complexity = np.where(area > 0, perim / area, np.nan)
+    return {
+        "area": area / 100,
+        "perim": perim / 10,
+        "x_perim": x_perim / 10,
+        "y_perim": y_perim / 10,
+        "complexity": complexity,
+    }
+
+
+def beam_statistics(
+        counts: Sequence[int],
+        leaves: np.ndarray,
+        leaf_boundaries: np.ndarray,
+        meterset: np.ndarray,
+        beam_mu: np.ndarray,
+        jaws_x: Optional[np.ndarray] = None,
+        jaws_y: Optional[np.ndarray] = None,
+        gantry: Optional[np.ndarray] = None
+    ) -> Dict[str, np.ndarray]:
+    """Kontrollpunktstatistikk for en hel bunke felt
+
+    Kontrollpunktene for alle felt ligger etter hverandre langs første akse, og ``counts`` angir antall
+    kontrollpunkter per felt. ``meterset`` er kumulativ meterset-vekt (DICOM Cumulative Meterset Weight),
+    ``beam_mu`` MU per felt og ``gantry`` gantryvinkel per kontrollpunkt. Bunken må ha felles MLC-type
+    (``leaf_boundaries``).
+
+    Gir arrays med samme navn som feltene i ``RT.Beam``: ``area_*``, ``perim_*``, ``x_perim_*``,
+    ``y_perim_*``, ``complexity_*``, ``cp_mu_*``, ``beam_mu_per_deg``, ``beam_mu_per_cp``,
+    ``beam_complexity`` og ``control_point_count``."""
+
+    counts = np.asarray(counts, dtype=np.int64)
+    n = len(counts)
+    group = np.repeat(np.arange(n), counts)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    beam_mu = np.asarray(beam_mu, dtype=float)
+
+    out: Dict[str, np.ndarray] = {"control_point_count": counts}
+    cp = apertures(leaves, leaf_boundaries, jaws_x, jaws_y)
+    for name in ("area", "perim", "x_perim", "y_perim", "complexity"):
+        for stat, values in grouped_stats(cp[name], group, n).items():
+            out[f"{name}_{stat}"] = values
+
+    # MU per segment: differansen i kumulativ vekt innenfor hvert felt, skalert til feltets MU
+    meterset = np.asarray(meterset, dtype=float)
+    final = meterset[np.maximum(starts + counts - 1, 0)] if len(meterset) else np.zeros(n)
+    segment = np.diff(meterset, prepend=np.nan)
+    segment[starts[counts > 0]] = np.nan  # første kontrollpunkt i hvert felt har ingen foregående
+    with np.errstate(divide="ignore", invalid="ignore"):
+        scale = np.where(final > 0, beam_mu / final, np.nan)
+    cp_mu = segment * scale[group]
+    for stat, values in grouped_stats(cp_mu, group, n).items():
+        out[f"cp_mu_{stat}"] = values
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        out["beam_mu_per_cp"] = np.where(counts > 1, beam_mu / (counts - 1), np.nan)
+
+        # Youngs feltkompleksitet: MU-vektet snitt av kompleksiteten i segmentets to kontrollpunkter
+        complexity = cp["complexity"]
+        pair = (complexity + np.roll(complexity, 1)) / 2
+        weighted = np.where(np.isfinite(pair) & np.isfinite(cp_mu), pair * cp_mu, 0.0)
+        weight = np.where(np.isfinite(pair) & np.isfinite(cp_mu), cp_mu, 0.0)
+        total = np.bincount(group, weights=weight, minlength=n)
+        out["beam_complexity"] = np.where(total > 0, np.bincount(group, weights=weighted, minlength=n) / total, np.nan)
+
+        if gantry is not None:
+            step = np.abs((np.diff(np.asarray(gantry, dtype=float), prepend=np.nan) + 180) % 360 - 180)
+            step[starts[counts > 0]] = 0
+            travel = np.bincount(group, weights=step, minlength=n)
+            out["beam_mu_per_deg"] = np.where(travel > 0, beam_mu / travel, np.nan)
+        else:
+            out["beam_mu_per_deg"] = np.full(n, np.nan)
+    return out
+
+
+def beam_fields(stats: Dict[str, np.ndarray]) -> List[dict]:
+    """Ett dict per felt, klart for ``RT.Beam`` (NaN blir None)."""
+    n = len(stats["control_point_count"])
+    rows = [{} for _ in range(n)]
+    for name, values in stats.items():
+        for row, value in zip(rows, values.tolist()):
+            row[name] = None if isinstance(value, float) and value != value else value
+    return rows
+
+
+def _reference_apertures(leaves, leaf_boundaries, jaws_x, jaws_y) -> np.ndarray:
+    """Kontrollpunkt for kontrollpunkt med Python-løkker; kun for referanse og benchmark."""
+    areas = []
+    for cp in range(len(leaves)):
+        area = 0.0
+        for i in range(leaves.shape[2]):
+            x1 = max(leaves[cp, 0, i], jaws_x[cp, 0])
+            x2 = min(leaves[cp, 1, i], jaws_x[cp, 1])
+            y1 = max(leaf_boundaries[i], jaws_y[cp, 0])
+            y2 = min(leaf_boundaries[i + 1], jaws_y[cp, 1])
+            if x2 > x1 and y2 > y1:
+                area += (x2 - x1) * (y2 - y1)
+        areas.append(area / 100)
+    return np.array(areas)
+
+
+def synthetic_vmat(beams: int, control_points: int = 178, seed: int = 0):
+    """Syntetiske VMAT-felt (Millennium 120: 60 bladpar, 10/5 mm) for benchmark."""
+    rng = np.random.default_rng(seed)
+    leaf_boundaries = np.concatenate((
+        np.arange(-200, -100, 10), np.arange(-100, 100, 5), np.arange(100, 201, 10)
+    )).astype(float)
+    total = beams * control_points
+    centre = rng.normal(0, 20, (total, 1)) + np.cumsum(rng.normal(0, 2, (total, 60)), axis=1)
+    half = np.abs(rng.normal(25, 10, (total, 60)))
+    leaves = np.stack((centre - half, centre + half), axis=1)
+    jaws_x = np.tile([-60.0, 60.0], (total, 1))
+    jaws_y = np.tile([-70.0, 70.0], (total, 1))
+    meterset = np.tile(np.linspace(0, 1, control_points), beams)
+    gantry = np.tile(np.linspace(181, 179 + 360, control_points) % 360, beams)
+    counts = np.full(beams, control_points)
+    beam_mu = rng.uniform(200, 600, beams)
+    return counts, leaves, leaf_boundaries, meterset, beam_mu, jaws_x, jaws_y, gantry
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    beams = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    counts, leaves, bounds, meterset, beam_mu, jaws_x, jaws_y, gantry = synthetic_vmat(beams)
+
+    start = time.perf_counter()
+    stats = beam_statistics(counts, leaves, bounds, meterset, beam_mu, jaws_x, jaws_y, gantry)
+    vectorized = time.perf_counter() - start
+
+    sample = int(counts[0])
+    start = time.perf_counter()
+    reference = _reference_apertures(leaves[:sample], bounds, jaws_x[:sample], jaws_y[:sample])
+    looped = (time.perf_counter() - start) * beams
+    assert np.allclose(reference, apertures(leaves[:sample], bounds, jaws_x[:sample], jaws_y[:sample])["area"])
+
+    print(
+        f"{beams} VMAT-felt à {sample} kontrollpunkter: {vectorized:.2f} s vektorisert "
+        f"({vectorized / beams * 1000:.2f} ms per felt), ca. {looped:.1f} s med løkker per kontrollpunkt (kun areal)"
+    )
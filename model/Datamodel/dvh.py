@@ -0,0 +1,135 @@
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+# Standard doseakse i Strukturer.Plan: 0.1 Gy binbredde, verdien i bin k gjelder dose >= k * 0.1 Gy
+BIN_WIDTH = 0.1
+
+DOSE_PERCENTILES = (2, 10, 20, 30, 40, 50, 60, 70, 80, 90, 98)
+VOLUME_DOSES_GY = (5, 10, 15, 20, 25, 30, 35, 40, 45, 50, 55, 60, 65, 70)
+
+
+def dvh_matrix(
+        doses_nested: Sequence[Sequence[float]],
+        volumes_nested: Sequence[Sequence[float]],
+        bin_width: float = BIN_WIDTH,
+        bins: Optional[int] = None
+    ) -> np.ndarray:
+    """Kumulative DVH-er fra ``dvh_doses_gy_nested``/``dvh_relative_volumes_nested`` som én matrise (S, B)
+
+    Alle strukturer legges på felles doseakse med ``bin_width``, og fylles med 0 etter siste bin. Strukturer
+    som allerede ligger på standardaksen kopieres direkte; andre interpoleres lineært."""
+    lengths = [len(v) for v in volumes_nested]
+    if bins is None:
+        top = max((d[-1] for d in doses_nested if len(d)), default=0.0)
+        bins = max(int(np.ceil(top / bin_width + 0.5)) + 1, max(lengths, default=0) + 1, 1)
+    out = np.zeros((len(volumes_nested), bins))
+    edges = np.arange(bins) * bin_width
+    for s, (doses, volumes) in enumerate(zip(doses_nested, volumes_nested)):
+        n = min(len(volumes), bins)
+        if not n:
+            continue
+        doses = np.asarray(doses, dtype=float)
+        volumes = np.asarray(volumes, dtype=float)
+        if len(doses) > 1 and np.isclose(doses[1] - doses[0], bin_width) and np.isclose(doses[0], bin_width / 2):
+            out[s, :n] = volumes[:n]
+        else:
+            out[s] = np.interp(edges, doses - bin_width / 2, volumes, left=volumes[0], right=0.0)
+    # Kumulative DVH-er er ikke-økende; avrundingsstøy fra TPS fjernes
+    return np.minimum.accumulate(np.clip(out, 0.0, 1.0), axis=1)
+
+
+def differential(cumulative: np.ndarray) -> np.ndarray:
+    """Andel av volumet i hver bin (k * bw <= D < (k + 1) * bw)."""
+    return cumulative - np.concatenate((cumulative[:, 1:], np.zeros((len(cumulative), 1))), axis=1)
+
+
+def cumulative_from_differential(diff: np.ndarray) -> np.ndarray:
+    return np.clip(np.cumsum(diff[:, ::-1], axis=1)[:, ::-1], 0.0, 1.0)
+
+
+def dose_at_volume(cumulative: np.ndarray, fraction, bin_width: float = BIN_WIDTH) -> np.ndarray:
+    """Største dose som minst ``fraction`` av volumet får (D_x), lineært interpolert mellom binkanter.
+    ``fraction`` kan være skalar eller én verdi per struktur."""
+    fraction = np.broadcast_to(np.asarray(fraction, dtype=float), (len(cumulative),))
+    last = (cumulative >= fraction[:, None]).sum(axis=1) - 1
+    valid = (last >= 0) & (fraction > 0) & (fraction <= 1)
+    k = np.clip(last, 0, cumulative.shape[1] - 2)
+    here = np.take_along_axis(cumulative, k[:, None], axis=1)[:, 0]
+    after = np.take_along_axis(cumulative, k[:, None] + 1, axis=1)[:, 0]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = np.where(here > after, (here - fraction) / (here - after), 0.0)
+    return np.where(valid, (k + np.clip(t, 0.0, 1.0)) * bin_width, np.nan)
+
+
+def doses_at_volumes(cumulative: np.ndarray, fractions: np.ndarray, bin_width: float = BIN_WIDTH) -> np.ndarray:
+    """D_x for et helt gitter av volumandeler (S, P), med ett binærsøk over alle strukturer samtidig."""
+    s, b = cumulative.shape
+    fractions = np.asarray(fractions, dtype=float)
+    # Radene forskyves med 2 slik at -V blir ikke-avtagende over hele den flate matrisen
+    shift = 2.0 * np.arange(s)[:, None]
+    flat = (shift - cumulative).ravel()
+    last = np.searchsorted(flat, (shift - fractions[None, :]).ravel(), side="right").reshape(s, -1)
+    last = last - b * np.arange(s)[:, None] - 1
+    k = np.clip(last, 0, b - 2)
+    here = np.take_along_axis(cumulative, k, axis=1)
+    after = np.take_along_axis(cumulative, k + 1, axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = np.where(here > after, (here - fractions[None, :]) / (here - after), 0.0)
+    return np.where(last >= 0, (k + np.clip(t, 0.0, 1.0)) * bin_width, np.nan)
+
+
+def volume_at_dose(cumulative: np.ndarray, dose, bin_width: float = BIN_WIDTH) -> np.ndarray:
+    """Andel av volumet som får minst ``dose`` Gy (V_x), lineært interpolert mellom binkanter."""
+    dose = np.broadcast_to(np.asarray(dose, dtype=float), (len(cumulative),))
+    position = np.clip(dose / bin_width, 0, cumulative.shape[1] - 1)
+    k = np.minimum(np.floor(position).astype(np.int64), cumulative.shape[1] - 2)
+    k = np.maximum(k, 0)
+    t = np.clip(position - k, 0.0, 1.0)
+    here = np.take_along_axis(cumulative, k[:, None], axis=1)[:, 0]
+    after = np.take_along_axis(cumulative, np.minimum(k + 1, cumulative.shape[1] - 1)[:, None], axis=1)[:, 0]
+    return np.where(np.isnan(dose), np.nan, here * (1 - t) + after * t)
+
+
+def dvh_metrics(
+        cumulative: np.ndarray,
+        volumes_cc: Optional[np.ndarray] = None,
+        prescription_gy: Optional[np.ndarray] = None,
+        bin_width: float = BIN_WIDTH
+    ) -> Dict[str, np.ndarray]:
+    """Dosemetrikkene i ``RT.DVH`` for alle strukturer på én gang
+
+    Gir ``min_dose``, ``mean_dose``, ``max_dose``, ``d2`` … ``d98``, ``d2cc`` (krever ``volumes_cc``),
+    ``v5gy`` … ``v70gy`` og ``v95`` (krever ``prescription_gy``). V-verdier i prosent."""
+    s, b = cumulative.shape
+    out: Dict[str, np.ndarray] = {}
+    nonzero = cumulative > 0
+    has = nonzero.any(axis=1)
+    last = b - 1 - np.argmax(nonzero[:, ::-1], axis=1)
+    full = (cumulative >= 1 - 1e-9).sum(axis=1)
+
+    out["min_dose"] = np.where(full > 0, (full - 1) * bin_width, 0.0)
+    out["mean_dose"] = bin_width * (cumulative.sum(axis=1) - 0.5 * cumulative[:, 0])
+    out["max_dose"] = np.where(has, (last + 1) * bin_width, np.nan)
+    for p in DOSE_PERCENTILES:
+        out[f"d{p}"] = dose_at_volume(cumulative, p / 100, bin_width)
+    if volumes_cc is not None:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            out["d2cc"] = dose_at_volume(cumulative, np.where(volumes_cc > 0, 2.0 / volumes_cc, np.nan), bin_width)
+    for dose in VOLUME_DOSES_GY:
+        out[f"v{dose}gy"] = 100 * volume_at_dose(cumulative, dose, bin_width)
+    if prescription_gy is not None:
+        out["v95"] = 100 * volume_at_dose(cumulative, 0.95 * np.asarray(prescription_gy, dtype=float), bin_width)
+    if volumes_cc is not None:
+        out["integral_dose"] = out["mean_dose"] * volumes_cc
+    return out
+
+
+def metric_rows(metrics: Dict[str, np.ndarray]) -> List[dict]:
+    """Ett dict per struktur, klart for ``RT.DVH`` (NaN blir None)."""
+    n = len(next(iter(metrics.values()))) if metrics else 0
+    rows = [{} for _ in range(n)]
+    for name, values in metrics.items():
+        for row, value in zip(rows, np.asarray(values).tolist()):
+            row[name] = None if isinstance(value, float) and value != value else value
+    return rows
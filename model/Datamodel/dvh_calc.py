@@ -0,0 +1,234 @@
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from .Strukturer import Plan
+from .dvh import BIN_WIDTH
+from .rasterise import Grid, Mask, MaskCache, rasterise, structure_contours
+
+# Strukturer under denne grensen (cc) supersamples i snittplanet
+SMALL_STRUCTURE_CC = 5.0
+SUPERSAMPLE = 3
+
+
+class DoseGrid(NamedTuple):
+    """RTDOSE som numpy-array (nz, ny, nx) i Gy med gittergeometri."""
+    dose: np.ndarray
+    grid: Grid
+
+    @classmethod
+    def from_npy(cls, path: str, origin: Tuple[float, float, float], spacing: Tuple[float, float, float], scaling: float = 1.0) -> "DoseGrid":
+        """Leser en lokal .npy-dosematrise. ``scaling`` tilsvarer DICOM Dose Grid Scaling."""
+        dose = np.load(path, mmap_mode="r")
+        if scaling != 1.0:
+            dose = np.asarray(dose, dtype=np.float32) * np.float32(scaling)
+        return cls(dose, Grid(tuple(origin), tuple(spacing), tuple(dose.shape)))
+
+
+class StructureDVH(NamedTuple):
+    index: int
+    doses_gy: List[float]
+    relative_volumes: List[float]
+    volume_cc: float
+    supersampled: bool
+    dose_calc_sec: float
+    geom_calc_sec: float
+
+
+def histogram(doses: np.ndarray, bin_width: float = BIN_WIDTH) -> Tuple[List[float], List[float]]:
+    """Kumulativ DVH med ``bin_width`` (bin-sentre fra bw/2), som i ``Strukturer.Plan``."""
+    if not len(doses):
+        return [], []
+    counts = np.bincount(np.floor(np.asarray(doses) / bin_width).astype(np.int64))
+    cumulative = np.cumsum(counts[::-1])[::-1] / len(doses)
+    centres = (np.arange(len(cumulative)) + 0.5) * bin_width
+    return centres.tolist(), cumulative.tolist()
+
+
+def sample_dose(dose: np.ndarray, grid: Grid, mask: Mask, factor: int) -> np.ndarray:
+    """Dose i maskens voksler. Ved supersampling interpoleres dosen bilineært i snittplanet."""
+    k, j, i = mask.indices()
+    if factor == 1:
+        return np.asarray(dose[k, j, i], dtype=float)
+    # Posisjon på det grove gitteret: sentrene i finere voksler ligger mellom de grove sentrene
+    fy = (j + 0.5) / factor - 0.5
+    fx = (i + 0.5) / factor - 0.5
+    ny, nx = dose.shape[1], dose.shape[2]
+    j0 = np.clip(np.floor(fy).astype(np.int64), 0, ny - 1)
+    i0 = np.clip(np.floor(fx).astype(np.int64), 0, nx - 1)
+    j1, i1 = np.minimum(j0 + 1, ny - 1), np.minimum(i0 + 1, nx - 1)
+    ty, tx = np.clip(fy - j0, 0, 1), np.clip(fx - i0, 0, 1)
+    return (
+        dose[k, j0, i0] * (1 - ty) * (1 - tx) + dose[k, j0, i1] * (1 - ty) * tx
+        + dose[k, j1, i0] * ty * (1 - tx) + dose[k, j1, i1] * ty * tx
+    )
+
+
+# Maskecachen i hver arbeidsprosess. Dosematrisene caches ikke: de kobles til kun mens en oppgave kjører
+_masks = MaskCache()
+
+
+def structure_dvh(dose: np.ndarray, grid: Grid, plan_uid: Optional[str], contours, index: int,
+                  volume_cc: Optional[float] = None, bin_width: float = BIN_WIDTH) -> StructureDVH:
+    """DVH for struktur ``index`` i planen. Masken caches på (plan_uid, strukturindeks, gitter), så strukturer
+    med samme navn i ulike planer (eller i samme plan) ikke deler maske. Uten ``plan_uid`` caches ikke masken."""
+    start = time.perf_counter()
+    factor = SUPERSAMPLE if volume_cc is not None and volume_cc < SMALL_STRUCTURE_CC else 1
+    fine = grid.refined(factor)
+    key = (plan_uid, index, fine)
+    if plan_uid is not None and key in _masks:
+        mask = _masks.get(key)
+    else:
+        mask = rasterise(*contours, fine)
+        if plan_uid is not None:
+            _masks.put(key, mask)
+    geom = time.perf_counter() - start
+
+    start = time.perf_counter()
+    if mask is None or not mask.count():
+        doses, volumes, volume = [], [], 0.0
+    else:
+        doses, volumes = histogram(sample_dose(dose, grid, mask, factor), bin_width)
+        volume = mask.count() * fine.voxel_cc
+    return StructureDVH(index, doses, volumes, volume, factor > 1, time.perf_counter() - start, geom)
+
+
+def _task(doses: List[Tuple[str, tuple, str, Grid]], plan_uid: Optional[str], contours, index: int,
+          volume_cc: Optional[float], bin_width: float) -> List[StructureDVH]:
+    # Én oppgave per struktur for alle dosematrisene til planen, så masken lages én gang i samme prosess.
+    # Hver dosematrise kobles til og fra rundt beregningen, slik at prosessen ikke holder på minne etter at
+    # foreldreprosessen har fjernet segmentet.
+    results = []
+    for name, shape, dtype, grid in doses:
+        shm = SharedMemory(name=name)
+        try:
+            dose = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+            results.append(structure_dvh(dose, grid, plan_uid, contours, index, volume_cc, bin_width))
+        except Exception as exc:
+            # Tracebacken holder rammene med visningen inn i segmentet i live
+            raise exc.with_traceback(None) from None
+        finally:
+            dose = None
+            shm.close()
+    return results
+
+
+def _to_shared(dose: np.ndarray) -> SharedMemory:
+    shm = SharedMemory(create=True, size=max(dose.nbytes, 1))
+    try:
+        np.ndarray(dose.shape, dtype=dose.dtype, buffer=shm.buf)[...] = dose
+    except BaseException:
+        shm.close()
+        shm.unlink()
+        raise
+    return shm
+
+
+def apply_dvhs(plan: Plan, results: Iterable[StructureDVH]) -> Plan:
+    """Ny ``Strukturer.Plan`` med DVH-vektorer, ``structure_volumes`` og ``dose_calc_sec`` fylt inn.
+    ``geom_calc_sec`` hører til ``RT.DVH`` og hentes med ``geom_calc_secs``."""
+    count = len(plan.structure_names)
+    doses = list(plan.dvh_doses_gy_nested) + [[]] * (count - len(plan.dvh_doses_gy_nested))
+    volumes = list(plan.dvh_relative_volumes_nested) + [[]] * (count - len(plan.dvh_relative_volumes_nested))
+    calc = list(plan.dose_calc_sec) + [0.0] * (count - len(plan.dose_calc_sec))
+    structure_volumes = list(plan.structure_volumes) + [0.0] * (count - len(plan.structure_volumes))
+    for result in results:
+        doses[result.index] = result.doses_gy
+        volumes[result.index] = result.relative_volumes
+        calc[result.index] = result.dose_calc_sec
+        if result.volume_cc:
+            structure_volumes[result.index] = result.volume_cc
+    return plan.model_copy(update={
+        "dvh_doses_gy_nested": doses,
+        "dvh_relative_volumes_nested": volumes,
+        "dose_calc_sec": calc,
+        "structure_volumes": structure_volumes,
+    })
+
+
+def geom_calc_secs(plan: Plan, results: Iterable[StructureDVH]) -> List[Optional[float]]:
+    """``RT.DVH.geom_calc_sec`` per struktur i ``plan`` (``None`` for strukturer uten resultat)."""
+    out: List[Optional[float]] = [None] * len(plan.structure_names)
+    for result in results:
+        out[result.index] = result.geom_calc_sec
+    return out
+
+
+def _plan_groups(jobs: Iterable[Tuple[Plan, DoseGrid]]) -> Iterator[List[Tuple[Plan, DoseGrid]]]:
+    """Samler påfølgende jobber for samme plan (samme ``plan_uid``), f.eks. flere dosematriser for én plan."""
+    group: List[Tuple[Plan, DoseGrid]] = []
+    for plan, dose_grid in jobs:
+        if group and (plan.plan_uid is None or plan.plan_uid != group[0][0].plan_uid):
+            yield group
+            group = []
+        group.append((plan, dose_grid))
+    if group:
+        yield group
+
+
+def calculate_dvhs(
+        jobs: Iterable[Tuple[Plan, DoseGrid]],
+        workers: Optional[int] = None,
+        prefetch: int = 2,
+        bin_width: float = BIN_WIDTH
+    ) -> Iterator[Tuple[Plan, List[StructureDVH]]]:
+    """DVH-beregning for mange planer over alle kjerner
+
+    Hver dosematrise legges i delt minne én gang og deles av alle arbeidsprosessene. En arbeidsprosess er koblet
+    til en dosematrise kun mens en oppgave for den kjører, så delt minne er begrenset til dosematrisene for de
+    ``prefetch`` + 1 plangruppene som ligger ute, og frigjøres når gruppen er ferdig. Påfølgende jobber for samme
+    plan samles, og hver struktur er en egen oppgave som regner DVH for alle dosematrisene til planen, slik at
+    masken rasteriseres én gang. Opptil ``prefetch`` plangrupper ligger ute samtidig, slik at prosessene holdes
+    i arbeid mellom planene. Gir (plan med DVH fylt inn, resultat per struktur) i samme rekkefølge som ``jobs``."""
+
+    workers = workers or os.cpu_count() or 1
+    resource_tracker.ensure_running()
+    pending: deque = deque()
+
+    def release(shms):
+        for shm in shms:
+            shm.close()
+            shm.unlink()
+
+    def finish(entry):
+        group, shms, futures = entry
+        try:
+            per_structure = [future.result() for future in futures]
+        finally:
+            release(shms)
+        for j, (plan, _) in enumerate(group):
+            results = [structure[j] for structure in per_structure]
+            yield apply_dvhs(plan, results), results
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        try:
+            for group in _plan_groups(jobs):
+                shms, futures = [], []
+                pending.append((group, shms, futures))
+                doses = []
+                for _, dose_grid in group:
+                    dose = np.ascontiguousarray(dose_grid.dose)
+                    shm = _to_shared(dose)
+                    shms.append(shm)
+                    doses.append((shm.name, dose.shape, dose.dtype.str, dose_grid.grid))
+                plan = group[0][0]
+                for index in range(len(plan.structure_names)):
+                    volume = plan.structure_volumes[index] if index < len(plan.structure_volumes) else None
+                    futures.append(pool.submit(
+                        _task, doses, plan.plan_uid, structure_contours(plan, index), index, volume, bin_width
+                    ))
+                while len(pending) > prefetch:
+                    yield from finish(pending.popleft())
+            while pending:
+                yield from finish(pending.popleft())
+        finally:
+            for _, shms, futures in pending:
+                for future in futures:
+                    future.cancel()
+                release(shms)
@@ -0,0 +1,130 @@
+import heapq
+from collections import defaultdict
+from itertools import groupby
+from typing import Dict, Iterable, Iterator, List, Tuple, Type
+
+from pydantic import BaseModel
+
+from .EPJ import (
+    Course, Clinic, Studies, Comorbidity, PrevCancer, PrevTreatment, Adverse, Radiology,
+    Anatomy, AnatomyFreeText, Mets, LymphMets, MetsMethod, LabSample, LabTest,
+    TreatmentSurgery, TreatmentMedicine, TreatmentRT, TreatmentSummary
+)
+
+# (foreldermodell, samling, barnemodell, nøkkel i forelder, FK i barn)
+# Samlingene er barnesamlingene i EPJ-modellen (``exclude=True``, ``document_only``)
+CHILDREN: Tuple[Tuple[Type[BaseModel], str, Type[BaseModel], str, str], ...] = (
+    (Course, "clinics", Clinic, "crs_id", "cln_crs_id"),
+    (Course, "studies", Studies, "crs_id", "study_crs_id"),
+    (Clinic, "comorbidities", Comorbidity, "cln_id", "cmrb_cln_id"),
+    (Clinic, "prev_cancers", PrevCancer, "cln_id", "prvc_cln_id"),
+    (Clinic, "prev_treatments", PrevTreatment, "cln_id", "prvt_cln_id"),
+    (Clinic, "adverse_events", Adverse, "cln_id", "ae_cln_id"),
+    (Clinic, "radiology", Radiology, "cln_id", "rad_cln_id"),
+    (Clinic, "anatomy", Anatomy, "cln_id", "anat_cln_id"),
+    (Clinic, "anatomy_freetext", AnatomyFreeText, "cln_id", "anat_free_cln_id"),
+    (Clinic, "mets", Mets, "cln_id", "mets_cln_id"),
+    (Clinic, "lymph_mets", LymphMets, "cln_id", "lmets_cln_id"),
+    (Clinic, "lab_samples", LabSample, "cln_id", "sample_cln_id"),
+    (Clinic, "lab_tests", LabTest, "cln_id", "test_cln_id"),
+    (Clinic, "treatment_summaries", TreatmentSummary, "cln_id", "txsum_cln_id"),
+    (Mets, "methods", MetsMethod, "mets_id", "meth_mets_id"),
+    (LymphMets, "methods", MetsMethod, "lmets_id", "meth_lmets_id"),
+    (TreatmentSummary, "surgeries", TreatmentSurgery, "txsum_id", "txsurg_txsum_id"),
+    (TreatmentSummary, "medicines", TreatmentMedicine, "txsum_id", "txmed_txsum_id"),
+    (TreatmentSummary, "radiotherapy", TreatmentRT, "txsum_id", "txrt_txsum_id"),
+)
+
+TABLES: Tuple[Type[BaseModel], ...] = tuple(dict.fromkeys(
+    [Course] + [child for _, _, child, _, _ in CHILDREN]
+))
+
+
+COLLECTIONS: Dict[Type[BaseModel], Tuple[str, ...]] = {}
+for _parent, _collection, _, _, _ in CHILDREN:
+    COLLECTIONS[_parent] = COLLECTIONS.get(_parent, ()) + (_collection,)
+
+
+def _instance(model: Type[BaseModel], row) -> BaseModel:
+    """Modellobjekt for raden med tomme barnesamlinger. Dicts har feltnavn som nøkler (som i databasen);
+    objekter kopieres, slik at inndata ikke endres."""
+    empty = {collection: [] for collection in COLLECTIONS.get(model, ())}
+    if isinstance(row, BaseModel):
+        return row.model_copy(update=empty)
+    fields = model.model_fields
+    instance = model.model_validate({fields[k].alias or k if k in fields else k: v for k, v in row.items()})
+    for collection in empty:
+        setattr(instance, collection, [])
+    return instance
+
+
+def to_document(instance: BaseModel) -> dict:
+    """Nestet dict for et sammenstilt objekt. Barnesamlingene er ``exclude=True`` og tas med her."""
+    doc = instance.model_dump()
+    for collection in COLLECTIONS.get(type(instance), ()):
+        doc[collection] = [to_document(child) for child in getattr(instance, collection)]
+    return doc
+
+
+class AssembledCourses:
+    """Resultat fra sammenstilling: ``Course``-objekter med barnesamlingene fylt inn, og rader uten forelder
+    som (modellnavn, objekt)."""
+
+    def __init__(self, courses: List[Course], unlinked: List[Tuple[str, BaseModel]]):
+        self.courses = courses
+        self.unlinked = unlinked
+
+
+def assemble(tables: Dict[Type[BaseModel], Iterable]) -> AssembledCourses:
+    """Sammenstiller flate EPJ-tabeller til nestede ``Course``-objekter
+    Course -> {Clinic, Studies}, Clinic -> {Comorbidity, Adverse, Mets -> MetsMethod, LabSample, LabTest,
+    TreatmentSummary -> ...}, i de eksisterende barnesamlingene på modellene.
+
+    Radene kan være modellobjekter eller dicts (valideres). Hver tabell leses én gang og kobles med
+    hash-oppslag på FK, så tiden er lineær i antall rader. Barnerader som ikke kan kobles mot noen forelder
+    gis ut i ``unlinked``."""
+
+    instances: Dict[Type[BaseModel], List[BaseModel]] = {
+        model: [_instance(model, row) for row in tables.get(model, ())] for model in TABLES
+    }
+
+    linked = defaultdict(set)
+    for parent, collection, child, parent_key, child_fk in CHILDREN:
+        index = {}
+        for instance in instances[parent]:
+            key = getattr(instance, parent_key)
+            if key is not None:
+                index[key] = instance
+        for i, instance in enumerate(instances[child]):
+            parent_instance = index.get(getattr(instance, child_fk))
+            if parent_instance is not None:
+                getattr(parent_instance, collection).append(instance)
+                linked[child].add(i)
+
+    unlinked = [
+        (model.__name__, instance)
+        for model in TABLES if model is not Course
+        for i, instance in enumerate(instances[model]) if i not in linked[model]
+    ]
+    return AssembledCourses(instances[Course], unlinked)
+
+
+def _record_id(row):
+    return row.record_id if isinstance(row, BaseModel) else row.get("record_id")
+
+
+def assemble_stream(tables: Dict[Type[BaseModel], Iterable]) -> Iterator[Tuple[str, AssembledCourses]]:
+    """Strømmende variant av ``assemble``. Hver tabell må være sortert på ``record_id``; tabellene flettes
+    og sammenstilles én pasient om gangen, slik at kun én pasient ligger i minnet av gangen."""
+
+    def keyed(order, model):
+        for i, row in enumerate(tables[model]):
+            yield _record_id(row) or "", order, i, model, row
+
+    streams = [keyed(order, model) for order, model in enumerate(TABLES) if model in tables]
+    merged = heapq.merge(*streams, key=lambda item: item[:3])
+    for record_id, group in groupby(merged, key=lambda item: item[0]):
+        grouped = defaultdict(list)
+        for _, _, _, model, row in group:
+            grouped[model].append(row)
+        yield record_id, assemble(grouped)
@@ -0,0 +1,217 @@
+import hashlib
+import hmac
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple, Type
+
+from pydantic import BaseModel
+from pydantic.fields import FieldInfo
+
+KEY_FIELDS = ("record_id", "pseudo_key")
+
+# Rot for UID-er avledet fra 128-bits heltall (DICOM PS3.5 B.2)
+UID_ROOT = "2.25."
+
+# Direkte identifiserende felt i modeller uten ``document_only``/``encrypted`` for dette; utelates
+DROP_FIELDS = ("PersNo", "PIDno", "Fodselsdato", "Fodselsar")
+
+# Interne ID-er uten ``hidden`` som trengs for kobling mellom kildene (OIS Course ID i NPR og RT, NPR-kontakt)
+PSEUDONYM_FIELDS = ("Kno", "BehSerieId", "RefVolumId", "sample_req_id")
+PSEUDONYM_SUFFIX = "_course_id"
+
+# Feltnavn som ser identifiserende ut. Slike felt må dekkes av en regel over eller stå i ``PUBLIC_FIELDS``,
+# ellers feiler utleveringen.
+PUBLIC_FIELDS = ("export_template_id",)
+IDENTIFYING = re.compile(r"(_id|Id|ID|no|_nr|_key|_aes|uid)$")
+
+KEY, UID, PSEUDONYM, DROP, KEEP = "key", "uid", "pseudonym", "drop", "keep"
+
+
+def uid_fields(model: Type[BaseModel]) -> Tuple[str, ...]:
+    """Feltnavn som inneholder DICOM UID-er, f.eks. ``plan_uid``, ``struct_for_uid`` og ``PlanUID``."""
+    return tuple(name for name in model.model_fields if name.lower().endswith("uid"))
+
+
+def field_action(name: str, info: FieldInfo) -> str:
+    """Hva utleveringen gjør med ett felt, ut fra feltets metadata."""
+    extra = info.json_schema_extra if isinstance(info.json_schema_extra, dict) else {}
+    if name in KEY_FIELDS:
+        return KEY
+    if name.lower().endswith("uid"):
+        return UID
+    if extra.get("document_only") or name in DROP_FIELDS or name.endswith("_aes") \
+            or "Kryptert datafelt" in (info.description or ""):
+        return DROP
+    if extra.get("hidden") or name in PSEUDONYM_FIELDS or name.endswith(PSEUDONYM_SUFFIX):
+        return PSEUDONYM
+    if IDENTIFYING.search(name) and name not in PUBLIC_FIELDS:
+        raise ValueError(f"Feltet {name} ser identifiserende ut, men har ingen regel for utlevering")
+    return KEEP
+
+
+_policies: Dict[Type[BaseModel], Dict[str, str]] = {}
+
+
+def export_policy(model: Type[BaseModel]) -> Dict[str, str]:
+    """Handling per felt for en modell (se ``field_action``). Barnesamlinger (``exclude``) utleveres ikke."""
+    policy = _policies.get(model)
+    if policy is None:
+        policy = _policies[model] = {
+            name: DROP if info.exclude else field_action(name, info)
+            for name, info in model.model_fields.items()
+        }
+    return policy
+
+
+def pseudo_uid(uid: str, secret: bytes) -> str:
+    """Deterministisk pseudonymisert UID for én utlevering."""
+    digest = hmac.new(secret, uid.encode("ascii"), hashlib.sha256).digest()
+    return UID_ROOT + str(int.from_bytes(digest[:16], "big"))
+
+
+def pseudo_id(value: str, secret: bytes) -> str:
+    """Deterministisk pseudonym for en intern ID, slik at koblinger mellom tabeller beholdes i utleveringen."""
+    return hmac.new(secret, b"id:" + str(value).encode("utf-8"), hashlib.sha256).hexdigest()[:16]
+
+
+def build_uid_map(uids: Iterable[str], secret: bytes, known: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    """Lager koblingstabell for UID-er. Eksisterende koblinger (f.eks. fra MapStudyUID) i ``known`` beholdes."""
+    uid_map = dict(known or {})
+    for uid in uids:
+        if uid and uid not in uid_map:
+            uid_map[uid] = pseudo_uid(uid, secret)
+    return uid_map
+
+
+class ExportCount(NamedTuple):
+    written: int
+    skipped: int
+
+
+class ExportMapping:
+    """Koblingstabell for én utlevering
+       ================================
+
+        ``keys`` kobler ``record_id`` / ``pseudo_key`` i registeret mot ``PatientExport.pseudo_key_aes``
+        (dekryptert) for denne utleveringen, og ``uids`` kobler opprinnelige DICOM UID-er mot nye. Øvrige
+        interne ID-er (``hidden`` og ``PSEUDONYM_FIELDS``) erstattes med ``pseudo_id`` under ``secret``, og
+        direkte identifiserende felt utelates (se ``export_policy``).
+
+        UID-er som mangler i tabellen gir ``KeyError``, og kolonner som ikke finnes i modellen gir
+        ``ValueError``, slik at opprinnelige identifikatorer aldri utleveres."""
+
+    def __init__(self, keys: Dict[str, str], uids: Dict[str, str], secret: bytes):
+        self.keys = keys
+        self.uids = uids
+        self.secret = secret
+
+    def includes(self, row: dict) -> bool:
+        """Sann dersom raden tilhører en pasient i utleveringen. Rader uten pasientnøkkel gir ``ValueError``."""
+        values = [row.get(field) for field in KEY_FIELDS if row.get(field) is not None]
+        if not values:
+            raise ValueError(f"Rad uten {' eller '.join(KEY_FIELDS)} kan ikke knyttes til en pasient")
+        return any(value in self.keys for value in values)
+
+    def rewrite(self, row: dict, policy: Dict[str, str]) -> dict:
+        out = {}
+        for name, value in row.items():
+            action = policy.get(name)
+            if action is None:
+                raise ValueError(f"Ukjent kolonne {name} i utlevering")
+            if action == DROP:
+                continue
+            if value is not None and value != "":
+                if action == KEY:
+                    value = self.keys[value]
+                elif action == UID:
+                    value = self.uids[value]
+                elif action == PSEUDONYM:
+                    value = pseudo_id(value, self.secret)
+            out[name] = value
+        return out
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Kan ikke serialisere {type(value).__name__}")
+
+
+_worker_mapping: Optional[ExportMapping] = None
+
+
+def _init_worker(mapping: ExportMapping):
+    global _worker_mapping
+    _worker_mapping = mapping
+
+
+def _write_chunk(path: str, rows: List[dict], policy: Dict[str, str]) -> Tuple[str, int]:
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for row in rows:
+            f.write(json.dumps(_worker_mapping.rewrite(row, policy), default=_json_default, ensure_ascii=False))
+            f.write("\n")
+    os.replace(tmp_path, path)
+    return path, len(rows)
+
+
+def _chunks(rows: Iterable[dict], size: int) -> Iterator[List[dict]]:
+    it = iter(rows)
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def run_export(
+        sources: Dict[str, Tuple[Type[BaseModel], Iterable[dict]]],
+        mapping: ExportMapping,
+        out_dir: str,
+        chunk_size: int = 10000,
+        workers: Optional[int] = None,
+        strict: bool = False
+    ) -> Dict[str, ExportCount]:
+    """Strømmer RT-, EPJ- og strukturdata for utleveringens pasienter gjennom ``mapping`` og skriver
+    utleveringen som JSON Lines i biter (``<navn>-00000.jsonl``, ...) fordelt over en prosesspool.
+
+    ``sources`` kobler et navn mot (modell, rader), der radene er dicts med feltnavn som nøkler.
+    Kun et begrenset antall biter er under arbeid samtidig, slik at minnebruken er uavhengig av
+    størrelsen på utleveringen. Modellenes felt kontrolleres (``export_policy``) før noe skrives.
+
+    Rader for pasienter som ikke er med i ``mapping`` hoppes over og telles; med ``strict`` gir de ``KeyError``.
+    Returnerer antall skrevne og overhoppede rader per kilde."""
+
+    policies = {name: export_policy(model) for name, (model, _) in sources.items()}
+    os.makedirs(out_dir, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    written = {name: 0 for name in sources}
+    skipped = {name: 0 for name in sources}
+
+    def selected(name, rows):
+        for row in rows:
+            if mapping.includes(row):
+                yield row
+            elif strict:
+                raise KeyError(f"{name}: rad for pasient som ikke er med i utleveringen")
+            else:
+                skipped[name] += 1
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(mapping,)) as pool:
+        pending = []
+        for name, (model, rows) in sources.items():
+            for i, chunk in enumerate(_chunks(selected(name, rows), chunk_size)):
+                path = os.path.join(out_dir, f"{name}-{i:05d}.jsonl")
+                pending.append((name, pool.submit(_write_chunk, path, chunk, policies[name])))
+                # Begrens antall biter i minnet
+                while len(pending) >= 2 * workers:
+                    done_name, future = pending.pop(0)
+                    written[done_name] += future.result()[1]
+        for done_name, future in pending:
+            written[done_name] += future.result()[1]
+
+    return {name: ExportCount(written[name], skipped[name]) for name in sources}
@@ -0,0 +1,179 @@
+from bisect import bisect_left
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .RT import Fraction, Plan
+
+_LAST = datetime.max
+
+
+def _get(row, name):
+    return row.get(name) if isinstance(row, dict) else getattr(row, name)
+
+
+def fraction_key(number: Optional[int], time: Optional[datetime], record_key: Optional[str] = None) -> Tuple[float, datetime, str]:
+    """Identitet og sorteringsnøkkel for en fraksjon innenfor en plan.
+
+    Fraksjoner med nummer identifiseres av ``fx_number`` alene, slik at en rad som sendes på nytt med
+    korrigert tidspunkt erstatter den gamle. Uten nummer brukes tidspunktet, og uten begge må ``record_key``
+    (f.eks. SOP Instance UID for RT Record) oppgis. Fraksjoner uten nummer sorteres sist."""
+    if number is not None:
+        return (number, _LAST, "")
+    if time is None and not record_key:
+        raise ValueError("Fraksjon uten fx_number og fx_datetime må ha record_key")
+    return (float("inf"), time if time is not None else _LAST, record_key or "")
+
+
+class _PlanIndex:
+    """Sortert fraksjonsindeks for én plan med kumulativ dose (prefikssum)."""
+
+    def __init__(self):
+        self.keys: List[Tuple[float, datetime, str]] = []
+        self.fractions: List[Tuple[Optional[int], Optional[datetime]]] = []
+        self.doses: List[float] = []
+        self.cumulative: List[Optional[float]] = []
+        self.dirty_from: Optional[int] = None
+        self.changed = set()
+
+    def _mark(self, index: int):
+        self.dirty_from = index if self.dirty_from is None else min(self.dirty_from, index)
+
+    def add(self, number: Optional[int], time: Optional[datetime], dose: Optional[float], record_key: Optional[str] = None) -> bool:
+        key = fraction_key(number, time, record_key)
+        dose = dose or 0.0
+        i = bisect_left(self.keys, key)
+        if i < len(self.keys) and self.keys[i] == key:
+            if self.doses[i] == dose and self.fractions[i] == (number, time):
+                return False
+            if self.fractions[i] != (number, time):
+                # Korrigert tidspunkt for samme fraksjonsnummer
+                self.fractions[i] = (number, time)
+                self.changed.add(key)
+                if self.doses[i] == dose:
+                    return True
+            self.doses[i] = dose
+            # fx_completion endres selv om prefikssummen skulle bli lik
+            self.changed.add(key)
+        else:
+            self.keys.insert(i, key)
+            self.fractions.insert(i, (number, time))
+            self.doses.insert(i, dose)
+            self.cumulative.insert(i, None)
+        self._mark(i)
+        return True
+
+    def refresh(self):
+        """Oppdaterer prefikssummen fra første endrede posisjon. Nøkler med endret verdi samles i ``changed``."""
+        start = self.dirty_from
+        self.dirty_from = None
+        if start is None:
+            return
+        running = self.cumulative[start - 1] if start > 0 else 0.0
+        for i in range(start, len(self.doses)):
+            running += self.doses[i]
+            if self.cumulative[i] != running:
+                self.cumulative[i] = running
+                self.changed.add(self.keys[i])
+
+    def take_changed(self) -> List[int]:
+        self.refresh()
+        changed = sorted(bisect_left(self.keys, key) for key in self.changed)
+        self.changed.clear()
+        return changed
+
+    @property
+    def total(self) -> float:
+        # En fraksjon lagt inn tidligere i rekkefølgen gjør prefikssummen bak seg ugyldig til neste ``refresh``
+        self.refresh()
+        return self.cumulative[-1] if self.cumulative else 0.0
+
+
+class FractionTracker:
+    """Kumulativ dose og fullføringsgrad per plan
+       ==========================================
+
+        Holder en sortert fraksjonsindeks per plan UID (se ``fraction_key``) og kumulativ levert dose som
+        prefikssum. Fraksjoner kan komme i vilkårlig rekkefølge; en sen fraksjon gjør kun prefikssummen fra sin
+        egen posisjon ugyldig. Ved vanlig daglig import (nye fraksjoner sist) koster hver fraksjon et binærsøk
+        og et tillegg på slutten. En fraksjon som kommer inn tidligere i rekkefølgen koster O(n) for planen, både
+        for innsettingen i listene og for å oppdatere prefikssummen bak den; n er antall fraksjoner i planen
+        (typisk under 40), så sorterte lister er raskere enn et tre i praksis.
+
+        ``flush`` gir deltaer for ``RT.Fraction`` (``cumulative_dose_delivered``, ``fx_completion``) og
+        ``RT.Plan`` (``plan_completion``) for det som er endret siden forrige kall."""
+
+    def __init__(self):
+        self.plans: Dict[str, _PlanIndex] = {}
+        self.fx_dose_planned: Dict[str, float] = {}
+        self.total_dose_planned: Dict[str, float] = {}
+        self.emitted_completion: Dict[str, Optional[float]] = {}
+        self.dirty = set()
+
+    def set_planned(self, plan_uid: str, fx_dose_planned: Optional[float] = None, total_dose_planned: Optional[float] = None):
+        index = self.plans.setdefault(plan_uid, _PlanIndex())
+        if fx_dose_planned is not None and self.fx_dose_planned.get(plan_uid) != fx_dose_planned:
+            self.fx_dose_planned[plan_uid] = fx_dose_planned
+            # fx_completion endres for alle fraksjoner i planen
+            index._mark(0)
+            index.cumulative = [None] * len(index.cumulative)
+            self.dirty.add(plan_uid)
+        if total_dose_planned is not None and self.total_dose_planned.get(plan_uid) != total_dose_planned:
+            self.total_dose_planned[plan_uid] = total_dose_planned
+            self.dirty.add(plan_uid)
+
+    def add(self, fraction, record_key: Optional[str] = None):
+        plan_uid = _get(fraction, "fx_plan_uid")
+        index = self.plans.setdefault(plan_uid, _PlanIndex())
+        if index.add(_get(fraction, "fx_number"), _get(fraction, "fx_datetime"), _get(fraction, "fx_dose_delivered"), record_key):
+            self.dirty.add(plan_uid)
+
+    def consume(self, fractions: Iterable):
+        for fraction in fractions:
+            self.add(fraction)
+
+    def cumulative_dose(self, plan_uid: str, number: Optional[int], time: Optional[datetime] = None,
+                        record_key: Optional[str] = None) -> Optional[float]:
+        """Kumulativ dose til og med angitt fraksjon."""
+        index = self.plans.get(plan_uid)
+        if index is None:
+            return None
+        index.refresh()
+        key = fraction_key(number, time, record_key)
+        i = bisect_left(index.keys, key)
+        return index.cumulative[i] if i < len(index.keys) and index.keys[i] == key else None
+
+    def plan_completion(self, plan_uid: str, delivered: Optional[float] = None) -> Optional[float]:
+        """``plan_completion``: levert dose (standard: summen av RT Record-fraksjonene) / planlagt totaldose."""
+        planned = self.total_dose_planned.get(plan_uid)
+        if not planned:
+            return None
+        if delivered is None:
+            index = self.plans.get(plan_uid)
+            delivered = index.total if index is not None else 0.0
+        return delivered / planned
+
+    def flush(self) -> Tuple[List[Fraction], List[Plan]]:
+        """Returnerer endrede fraksjoner og planer siden forrige kall."""
+        fractions, plans = [], []
+        for plan_uid in sorted(self.dirty, key=str):
+            index = self.plans[plan_uid]
+            fx_planned = self.fx_dose_planned.get(plan_uid)
+            for i in index.take_changed():
+                number, time = index.fractions[i]
+                values = {
+                    "cumulative_dose_delivered": index.cumulative[i],
+                    "fx_completion": index.doses[i] / fx_planned if fx_planned else None,
+                }
+                fractions.append(Fraction.model_construct(
+                    _fields_set={"fx_plan_uid", "fx_number", "fx_datetime", *values},
+                    fx_plan_uid=plan_uid, fx_number=number, fx_datetime=time, **values
+                ))
+
+            completion = self.plan_completion(plan_uid)
+            if plan_uid not in self.emitted_completion or self.emitted_completion[plan_uid] != completion:
+                self.emitted_completion[plan_uid] = completion
+                plans.append(Plan.model_construct(
+                    _fields_set={"plan_uid", "plan_completion"}, plan_uid=plan_uid, plan_completion=completion
+                ))
+        self.dirty.clear()
+        return fractions, plans
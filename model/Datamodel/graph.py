@@ -0,0 +1,144 @@
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple, Type
+
+from pydantic import BaseModel
+
+from .Kodeliste import (
+    Registry, Patient, IDNumberHistory, Address, Course, DataStatus,
+    MapStudyUID, MapSeriesUID, MapInstanceUID
+)
+
+# Primærnøkkel for hver tabell i kodelisten
+PRIMARY_KEYS: Dict[Type[BaseModel], str] = {
+    Registry: "id",
+    Patient: "patient_key",
+    IDNumberHistory: "id",
+    Address: "id",
+    Course: "id",
+    DataStatus: "id",
+    MapStudyUID: "id",
+    MapSeriesUID: "id",
+    MapInstanceUID: "id",
+}
+
+# (modell, felt) -> (målmodell, fk-felt, mange)
+# For en-til-en / mange-til-en ligger fk-feltet på modellen selv, for en-til-mange ligger det på målmodellen.
+RELATIONS: Dict[Tuple[Type[BaseModel], str], Tuple[Type[BaseModel], str, bool]] = {
+    (Registry, "patients"): (Patient, "fk_registry_id", True),
+    (Patient, "registry"): (Registry, "fk_registry_id", False),
+    (Patient, "addresses"): (Address, "fk_patient_key", True),
+    (Patient, "courses"): (Course, "fk_patient_key", True),
+    (Patient, "id_history"): (IDNumberHistory, "fk_patient_key", True),
+    (Course, "patient"): (Patient, "fk_patient_key", False),
+    (Course, "data_status"): (DataStatus, "fk_datastatus_id", False),
+    (DataStatus, "course"): (Course, "fk_course_id", False),
+    (MapStudyUID, "course"): (Course, "fk_course_id", False),
+    (MapSeriesUID, "course"): (Course, "fk_course_id", False),
+    (MapInstanceUID, "course"): (Course, "fk_course_id", False),
+}
+
+
+def _key(value) -> Optional[str]:
+    # Course.fk_patient_key er str mens Patient.patient_key er int, så nøkler sammenlignes som tekst
+    return None if value is None else str(value)
+
+
+def _by_alias(model: Type[BaseModel], row: dict) -> dict:
+    fields = model.model_fields
+    return {fields[k].alias or k if k in fields else k: v for k, v in row.items()}
+
+
+class GraphLoader:
+    """Identitetskart for objektgrafen i kodelisten
+       =============================================
+
+        Bygger Kodeliste-objekter fra flate tabellrader (feltnavn som kolonner), slik at hver entitet
+        opprettes nøyaktig én gang. Relasjoner fylles ikke ved innlasting, men løses ved behov med
+        ``resolve`` via ``fk_*``-kolonnene, eller for hele grafen med ``link_all``. Begge deler er lineært
+        i antall rader. ``dump`` serialiserer et objekt med relasjoner uten å følge sykler, og løser relasjoner
+        som ikke er løst ennå underveis."""
+
+    def __init__(self):
+        self.identity: Dict[Type[BaseModel], Dict[str, BaseModel]] = defaultdict(dict)
+        self._children: Dict[Tuple[Type[BaseModel], str], Dict[str, List[BaseModel]]] = {}
+        # (id(objekt), relasjon) som er løst mot gjeldende innhold i identitetskartet
+        self._resolved: set = set()
+
+    def load(self, model: Type[BaseModel], rows: Iterable[dict]) -> List[BaseModel]:
+        """Laster rader inn i identitetskartet. Rader med kjent primærnøkkel gir eksisterende objekt."""
+        pk = PRIMARY_KEYS[model]
+        table = self.identity[model]
+        loaded = []
+        for row in rows:
+            key = _key(row[pk])
+            obj = table.get(key)
+            if obj is None:
+                obj = model.model_validate(_by_alias(model, row))
+                table[key] = obj
+            loaded.append(obj)
+        # Nye rader gjør tidligere gruppering og løste relasjoner mot denne modellen ugyldige
+        for index_key in [k for k in self._children if k[0] is model]:
+            del self._children[index_key]
+        stale = {attr for (_, attr), (target, _, _) in RELATIONS.items() if target is model}
+        self._resolved = {item for item in self._resolved if item[1] not in stale}
+        return loaded
+
+    def get(self, model: Type[BaseModel], key) -> Optional[BaseModel]:
+        return self.identity[model].get(_key(key))
+
+    def _grouped(self, model: Type[BaseModel], fk: str) -> Dict[str, List[BaseModel]]:
+        grouped = self._children.get((model, fk))
+        if grouped is None:
+            grouped = defaultdict(list)
+            for obj in self.identity[model].values():
+                grouped[_key(getattr(obj, fk))].append(obj)
+            self._children[(model, fk)] = grouped
+        return grouped
+
+    def resolve(self, obj: BaseModel, attr: str):
+        """Løser en relasjon for ett objekt og setter attributtet. Returnerer verdien."""
+        model = type(obj)
+        target, fk, many = RELATIONS[(model, attr)]
+        if many:
+            own_key = _key(getattr(obj, PRIMARY_KEYS[model]))
+            value = list(self._grouped(target, fk).get(own_key, ()))
+        else:
+            value = self.identity[target].get(_key(getattr(obj, fk)))
+        setattr(obj, attr, value)
+        self._resolved.add((id(obj), attr))
+        return value
+
+    def link_all(self):
+        """Løser alle kjente relasjoner for alle innlastede objekter."""
+        for (model, attr) in RELATIONS:
+            for obj in self.identity[model].values():
+                self.resolve(obj, attr)
+
+    def dump(self, obj: BaseModel, by_alias: bool = False) -> dict:
+        """Serialiserer ``obj`` med tilknyttede objekter. Objekter som allerede er skrevet ut erstattes
+        av primærnøkkelen sin, slik at sykler kuttes og hvert objekt skrives én gang."""
+        return self._dump(obj, set(), by_alias)
+
+    def _dump(self, obj: BaseModel, seen: set, by_alias: bool) -> dict:
+        seen.add(id(obj))
+        out = {}
+        model = type(obj)
+        for name, field in model.model_fields.items():
+            if (model, name) in RELATIONS and (id(obj), name) not in self._resolved:
+                value = self.resolve(obj, name)
+            else:
+                value = getattr(obj, name)
+            if isinstance(value, list):
+                value = [self._dump_value(v, seen, by_alias) for v in value]
+            else:
+                value = self._dump_value(value, seen, by_alias)
+            out[field.alias or name if by_alias else name] = value
+        return out
+
+    def _dump_value(self, value, seen: set, by_alias: bool):
+        if not isinstance(value, BaseModel):
+            return value
+        if id(value) in seen:
+            pk = PRIMARY_KEYS.get(type(value))
+            return {pk: getattr(value, pk)} if pk else None
+        return self._dump(value, seen, by_alias)
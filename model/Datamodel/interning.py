@@ -0,0 +1,172 @@
+import threading
+import tracemalloc
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Iterable, Optional, Type
+
+from pydantic import BaseModel, ConfigDict
+
+
+class InternCache:
+    """Begrenset LRU-cache for delte, uforanderlige modellinstanser. Trådsikker, slik at samme cache kan
+    brukes fra innlesere som validerer i flere tråder."""
+
+    def __init__(self, maxsize: int = 65536):
+        self.maxsize = maxsize
+        self.entries: "OrderedDict[tuple, BaseModel]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def intern(self, key: tuple, instance: BaseModel) -> BaseModel:
+        """Gir den delte instansen for ``key``, eller lagrer ``instance`` som delt instans."""
+        with self._lock:
+            shared = self.entries.get(key)
+            if shared is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return shared
+            self.misses += 1
+            self.entries[key] = instance
+            if len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+            return instance
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+            self.hits = self.misses = 0
+
+
+_cache: Optional[InternCache] = None
+_keys: Dict[Type[BaseModel], tuple] = {}
+_frozen: Dict[Type[BaseModel], Type[BaseModel]] = {}
+
+
+def enable_interning(maxsize: int = 65536) -> InternCache:
+    """Slår på interning av kodeverdier (``EPJ.Code``, ``EPJ.CodeValue``, ``EPJ.CodeValueBoth``)."""
+    global _cache
+    _cache = InternCache(maxsize)
+    return _cache
+
+
+def disable_interning():
+    global _cache
+    _cache = None
+
+
+@contextmanager
+def interning(maxsize: int = 65536):
+    global _cache
+    previous = _cache
+    cache = enable_interning(maxsize)
+    try:
+        yield cache
+    finally:
+        _cache = previous
+
+
+def _key_fields(cls: Type[BaseModel]) -> tuple:
+    fields = _keys.get(cls)
+    if fields is None:
+        fields = _keys[cls] = tuple(cls.model_fields)
+    return fields
+
+
+def frozen_type(cls: Type[BaseModel]) -> Type[BaseModel]:
+    """Uforanderlig underklasse av ``cls`` (samme navn, felt og serialisering) for delte instanser."""
+    if cls.model_config.get("frozen"):
+        return cls
+    frozen = _frozen.get(cls)
+    if frozen is None:
+        frozen = _frozen[cls] = type(cls.__name__, (cls,), {
+            "__module__": cls.__module__,
+            "__qualname__": cls.__qualname__,
+            "__doc__": cls.__doc__,
+            "model_config": ConfigDict(frozen=True),
+        })
+    return frozen
+
+
+def intern_model(cls: Type[BaseModel], value, handler):
+    """Wrap-validator: gir en delt instans fra cachen for like verdier når interning er slått på.
+
+    Nøkkelen bygges av de validerte feltverdiene, slik at f.eks. ``{"Målt verdi": "60"}`` og
+    ``{"Målt verdi": 60.0}`` gir samme instans, og ulike verdier aldri deler instans. Kun de delte
+    instansene er uforanderlige (``frozen_type``); uten interning kan kodeverdiene endres som før."""
+    instance = handler(value)
+    cache = _cache
+    if cache is None or type(instance) is not cls:
+        return instance
+    try:
+        key = (cls,) + tuple(getattr(instance, name) for name in _key_fields(cls))
+        hash(key)
+    except TypeError:  # uhashbare verdier
+        return instance
+    shared = frozen_type(cls).model_construct(_fields_set=instance.model_fields_set, **instance.__dict__)
+    return cache.intern(key, shared)
+
+
+def measure_interning(model: Type[BaseModel], rows: Iterable[dict]) -> dict:
+    """Måler minnebruk (tracemalloc) for validering av ``rows`` med og uten interning."""
+    global _cache
+    rows = list(rows)
+
+    def load():
+        tracemalloc.start()
+        try:
+            loaded = [model.model_validate(row) for row in rows]
+            size = tracemalloc.get_traced_memory()[0]
+        finally:
+            tracemalloc.stop()
+        del loaded
+        return size
+
+    previous = _cache
+    try:
+        disable_interning()
+        without = load()
+        with interning() as cache:
+            with_interning = load()
+            shared = len(cache.entries)
+    finally:
+        _cache = previous
+    return {
+        "rows": len(rows),
+        "bytes_without": without,
+        "bytes_with": with_interning,
+        "bytes_saved": without - with_interning,
+        "shared_instances": shared,
+    }
+
+
+def _synthetic_clinic_rows(count: int):
+    """Syntetiske Clinic-rader med et realistisk lite verdirom for kodeverdiene."""
+    from .EPJ import Clinic
+
+    code_fields = [
+        (field.alias, name) for name, field in Clinic.model_fields.items()
+        if "Code" in str(field.annotation) and "CodeValue" not in str(field.annotation)
+    ]
+    rows = []
+    for i in range(count):
+        row = {Clinic.model_fields["record_id"].alias: f"{i:07x}", Clinic.model_fields["cln_id"].alias: str(i)}
+        for j, (alias, name) in enumerate(code_fields):
+            v = str((i * 7 + j) % 5)
+            row[alias] = {"Kode": v, "Vist verdi": f"{name} {v}", "Terminologi": "DIPS"}
+        row[Clinic.model_fields["cln_weight"].alias] = {"Målt verdi": 60 + i % 40, "Enhet": "kg"}
+        rows.append(row)
+    return rows
+
+
+if __name__ == "__main__":
+    # Kjørt som ``python -m Datamodel.interning``: bruk modulen EPJ faktisk importerer, ikke __main__
+    from .EPJ import Clinic
+    from .interning import measure_interning, _synthetic_clinic_rows
+
+    result = measure_interning(Clinic, _synthetic_clinic_rows(20000))
+    print(
+        f"{result['rows']} Clinic-rader: {result['bytes_without'] / 2**20:.1f} MiB uten interning, "
+        f"{result['bytes_with'] / 2**20:.1f} MiB med interning "
+        f"({result['shared_instances']} delte instanser)"
+    )
@@ -0,0 +1,215 @@
+import csv
+import typing
+import xml.etree.ElementTree as ET
+from datetime import date, datetime
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+from .NPR import NPR
+
+DOSE_FIELDS = ("PlanTotDose", "DoseKorr", "PlanDose", "GittDose")
+FLAG_FIELDS = ("NyPas",)
+CODE_FIELDS = ("Pkode", "RegionKode", "RegionNavn", "Hdiag", "Machine", "Komm", "Bydel", "RefVolumNavn", "RefVolumId")
+
+DATETIME_FORMATS = ("%Y-%m-%dT%H:%M:%S", "%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%d.%m.%Y %H:%M:%S", "%d.%m.%Y %H:%M", "%Y-%m-%d", "%d.%m.%Y")
+
+
+class Categorical(NamedTuple):
+    """Kategorisk kolonne: heltallskoder mot ``categories``. Kode -1 betyr manglende verdi."""
+    codes: np.ndarray
+    categories: np.ndarray
+
+    def __len__(self):
+        return len(self.codes)
+
+    def values(self) -> np.ndarray:
+        out = np.empty(len(self.codes), dtype=object)
+        present = self.codes >= 0
+        out[present] = self.categories[self.codes[present]]
+        return out
+
+    def take(self, indices) -> "Categorical":
+        return Categorical(self.codes[indices], self.categories)
+
+
+def _literal_values(field: str) -> Optional[tuple]:
+    annotation = NPR.model_fields[field].annotation
+    if typing.get_origin(annotation) is typing.Literal:
+        return typing.get_args(annotation)
+    return None
+
+
+def _field_kind(field: str) -> str:
+    annotation = NPR.model_fields[field].annotation
+    if field in DOSE_FIELDS:
+        return "dose"
+    if field in FLAG_FIELDS:
+        return "flag"
+    if annotation is datetime:
+        return "datetime"
+    if annotation is date:
+        return "date"
+    if _literal_values(field) is not None or field in CODE_FIELDS:
+        return "code"
+    return "str"
+
+
+def _parse_datetimes(values: Sequence[str], unit: str) -> np.ndarray:
+    raw = np.array([v.strip() if v else "NaT" for v in values], dtype=object)
+    try:
+        return raw.astype(f"datetime64[{unit}]")
+    except ValueError:
+        pass
+    # Tregere vei for ikke-ISO formater (f.eks. dd.mm.yyyy)
+    parsed = []
+    for value in raw:
+        if value == "NaT":
+            parsed.append(np.datetime64("NaT"))
+            continue
+        for fmt in DATETIME_FORMATS:
+            try:
+                parsed.append(np.datetime64(datetime.strptime(value, fmt)))
+                break
+            except ValueError:
+                continue
+        else:
+            raise ValueError(f"Ukjent datoformat: {value!r}")
+    return np.array(parsed, dtype=f"datetime64[{unit}]")
+
+
+def _parse_decimals(values: Sequence[str]) -> np.ndarray:
+    raw = np.char.strip(np.array([v or "" for v in values], dtype=str))
+    raw = np.char.replace(raw, ",", ".")
+    out = np.full(len(raw), np.nan)
+    present = raw != ""
+    out[present] = raw[present].astype(np.float64)
+    return out
+
+
+def _parse_flags(values: Sequence[str]) -> np.ndarray:
+    return np.array([int(v) if v and v.strip() else -1 for v in values], dtype=np.int8)
+
+
+def _parse_codes(field: str, values: Sequence[str]) -> Categorical:
+    raw = np.array([v.strip() if v else "" for v in values], dtype=str)
+    categories, codes = np.unique(raw, return_inverse=True)
+    codes = codes.astype(np.int32)
+    if len(categories) and categories[0] == "":
+        categories = categories[1:]
+        codes -= 1
+    allowed = _literal_values(field)
+    if allowed is not None:
+        invalid = sorted(set(categories.tolist()) - set(allowed))
+        if invalid:
+            raise ValueError(f"Ugyldige verdier for {field}: {invalid}. Tillatt: {list(allowed)}")
+    return Categorical(codes, categories.astype(object))
+
+
+class NPRColumns:
+    """Kolonnebasert NPR-uttrekk
+       ========================
+
+        Typede kolonner for et NPR-uttrekk: doser som float (Gy), datoer som ``datetime64``, koder som
+        ``Categorical`` og ``NyPas`` som int8. ``Omsorg``, ``Intensjon`` og ``Kjonn`` sjekkes mot de samme
+        ``Literal``-verdiene som i ``NPR.NPR``."""
+
+    def __init__(self, columns: Dict[str, object]):
+        self.columns = columns
+
+    @classmethod
+    def from_strings(cls, columns: Dict[str, Sequence[str]]) -> "NPRColumns":
+        typed = {}
+        for field, values in columns.items():
+            if field not in NPR.model_fields:
+                continue
+            kind = _field_kind(field)
+            if kind == "dose":
+                typed[field] = _parse_decimals(values)
+            elif kind == "flag":
+                typed[field] = _parse_flags(values)
+            elif kind == "datetime":
+                typed[field] = _parse_datetimes(values, "s")
+            elif kind == "date":
+                typed[field] = _parse_datetimes(values, "D")
+            elif kind == "code":
+                typed[field] = _parse_codes(field, values)
+            else:
+                typed[field] = np.array(values, dtype=object)
+        return cls(typed)
+
+    def __len__(self):
+        return len(next(iter(self.columns.values()))) if self.columns else 0
+
+    def __getitem__(self, field: str):
+        return self.columns[field]
+
+    def take(self, indices) -> "NPRColumns":
+        return NPRColumns({field: column.take(indices) for field, column in self.columns.items()})
+
+    def to_arrow(self):
+        """Konverterer til ``pyarrow.Table``. Kategoriske kolonner blir dictionary-kolonner."""
+        import pyarrow as pa
+
+        arrays, names = [], []
+        for field, column in self.columns.items():
+            if isinstance(column, Categorical):
+                indices = pa.array(column.codes, mask=column.codes < 0)
+                arrays.append(pa.DictionaryArray.from_arrays(indices, pa.array(column.categories.tolist(), type=pa.string())))
+            elif column.dtype == object:
+                arrays.append(pa.array(column.tolist(), type=pa.string()))
+            elif column.dtype.kind == "f":
+                arrays.append(pa.array(column, mask=np.isnan(column)))
+            elif column.dtype.kind == "M":
+                arrays.append(pa.array(column, mask=np.isnat(column)))
+            else:
+                arrays.append(pa.array(column))
+            names.append(field)
+        return pa.Table.from_arrays(arrays, names=names)
+
+    @classmethod
+    def from_arrow(cls, table) -> "NPRColumns":
+        columns = {}
+        for field in table.column_names:
+            column = table.column(field).combine_chunks()
+            if hasattr(column, "dictionary"):
+                codes = column.indices.fill_null(-1).to_numpy(zero_copy_only=False).astype(np.int32)
+                columns[field] = Categorical(codes, np.array(column.dictionary.to_pylist(), dtype=object))
+            elif column.type == "string":
+                columns[field] = np.array(column.to_pylist(), dtype=object)
+            else:
+                columns[field] = column.to_numpy(zero_copy_only=False)
+        return cls(columns)
+
+
+def _collect(rows: Iterable[Dict[str, str]]) -> Dict[str, List[str]]:
+    columns: Dict[str, List[str]] = {}
+    for i, row in enumerate(rows):
+        for field, value in row.items():
+            columns.setdefault(field, [""] * i).append(value)
+        for field, column in columns.items():
+            if len(column) <= i:
+                column.append("")
+    return columns
+
+
+def read_csv(path: str, delimiter: Optional[str] = None, encoding: str = "utf-8-sig") -> NPRColumns:
+    """Leser et NPR-uttrekk i CSV-format. Skilletegn gjettes dersom det ikke er angitt."""
+    with open(path, newline="", encoding=encoding) as f:
+        if delimiter is None:
+            delimiter = csv.Sniffer().sniff(f.read(4096), delimiters=";,\t|").delimiter
+            f.seek(0)
+        return NPRColumns.from_strings(_collect(csv.DictReader(f, delimiter=delimiter)))
+
+
+def iter_xml_rows(path: str) -> Iterator[Dict[str, str]]:
+    """Strømmer rader fra et NPR-uttrekk i XML-format. Et element regnes som en rad dersom det har et ``Kno``-barn."""
+    for _, element in ET.iterparse(path, events=("end",)):
+        if element.find("Kno") is not None:
+            yield {child.tag: (child.text or "") for child in element}
+            element.clear()
+
+
+def read_xml(path: str) -> NPRColumns:
+    """Leser et NPR-uttrekk i XML-format."""
+    return NPRColumns.from_strings(_collect(iter_xml_rows(path)))
@@ -0,0 +1,99 @@
+import sqlite3
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .NPR import NPR
+from .utils import content_digest
+
+# Felter som kun brukes ved overføring (REDCap), og som ikke er en del av innholdet i kontakten
+CONTENT_FIELDS = tuple(
+    name for name, field in NPR.model_fields.items()
+    if not (field.json_schema_extra or {}).get("transfer_only")
+)
+
+
+def _get(row, name):
+    if isinstance(row, dict):
+        return row.get(name)
+    return getattr(row, name)
+
+
+def _as_datetime(value) -> Optional[datetime]:
+    if value is None or isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(str(value))
+
+
+class IncrementalNPR:
+    """Inkrementell innlesing av NPR-uttrekk
+       ====================================
+
+        Holder et vannmerke (siste ``InnDato``) per ``BehSerieId`` og en innholdshash per ``Kno`` i en
+        SQLite-fil. Kontakter eldre enn vannmerket minus ``lookback`` hoppes over uten oppslag, men telles i
+        ``stale`` per ``BehSerieId`` slik at sene endringer utenfor vinduet kan oppdages. Øvrige kontakter slås
+        opp på primærnøkkelen ``Kno``, slik at kun nye og endrede kontakter slippes gjennom. Oppstart leser
+        bare vannmerkene, så kostnaden per kjøring følger antall kontakter i uttrekket, ikke historikken.
+
+        Endringene lagres først når ``commit`` kalles, slik at en avbrutt synkronisering kan kjøres på nytt."""
+
+    def __init__(self, path: str, lookback: timedelta = timedelta(days=30)):
+        self.lookback = lookback
+        self.db = sqlite3.connect(path)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS seen (kno TEXT PRIMARY KEY, digest BLOB NOT NULL, beh_serie_id TEXT);
+            CREATE TABLE IF NOT EXISTS watermark (beh_serie_id TEXT PRIMARY KEY, inn_dato TEXT NOT NULL);
+        """)
+        self.watermarks: Dict[str, datetime] = {
+            serie: datetime.fromisoformat(inn_dato)
+            for serie, inn_dato in self.db.execute("SELECT beh_serie_id, inn_dato FROM watermark")
+        }
+        self._pending: Dict[str, Tuple[bytes, str]] = {}
+        self._pending_watermarks: Dict[str, datetime] = {}
+        self.stale: Dict[str, int] = {}
+
+    def _stored_digest(self, kno: str) -> Optional[bytes]:
+        if kno in self._pending:
+            return self._pending[kno][0]
+        found = self.db.execute("SELECT digest FROM seen WHERE kno = ?", (kno,)).fetchone()
+        return found[0] if found else None
+
+    def changes(self, rows: Iterable) -> Iterator[Tuple[str, object]]:
+        """Gir ("new", rad) eller ("changed", rad) for kontakter som ikke er sett med samme innhold før."""
+        for row in rows:
+            serie = _get(row, "BehSerieId")
+            inn_dato = _as_datetime(_get(row, "InnDato"))
+            watermark = self.watermarks.get(serie)
+            if watermark is not None and inn_dato is not None and inn_dato < watermark - self.lookback:
+                self.stale[serie] = self.stale.get(serie, 0) + 1
+                continue
+
+            kno = _get(row, "Kno")
+            digest = content_digest(_get(row, name) for name in CONTENT_FIELDS)
+            stored = self._stored_digest(kno)
+            if stored == digest:
+                continue
+
+            self._pending[kno] = (digest, serie)
+            if inn_dato is not None:
+                current = self._pending_watermarks.get(serie, watermark)
+                if current is None or inn_dato > current:
+                    self._pending_watermarks[serie] = inn_dato
+            yield ("new" if stored is None else "changed"), row
+
+    def commit(self):
+        """Lagrer hasher og vannmerker for kontaktene som er gitt ut siden forrige ``commit``."""
+        with self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO seen (kno, digest, beh_serie_id) VALUES (?, ?, ?)",
+                ((kno, digest, serie) for kno, (digest, serie) in self._pending.items())
+            )
+            self.db.executemany(
+                "INSERT OR REPLACE INTO watermark (beh_serie_id, inn_dato) VALUES (?, ?)",
+                ((serie, inn_dato.isoformat()) for serie, inn_dato in self._pending_watermarks.items())
+            )
+        self.watermarks.update(self._pending_watermarks)
+        self._pending.clear()
+        self._pending_watermarks.clear()
+
+    def close(self):
+        self.db.close()
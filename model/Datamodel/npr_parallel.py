@@ -0,0 +1,222 @@
+import multiprocessing as mp
+import os
+import zlib
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from .npr_columnar import NPRColumns
+
+
+def partition_of(values: np.ndarray, partitions: int) -> np.ndarray:
+    """Stabil hash-partisjonering (crc32) av f.eks. ``BehSerieId``, uavhengig av PYTHONHASHSEED."""
+    uniques, inverse = np.unique(np.asarray(values, dtype=str), return_inverse=True)
+    buckets = np.array([zlib.crc32(u.encode("utf-8")) % partitions for u in uniques], dtype=np.int64)
+    return buckets[inverse.reshape(-1)]
+
+
+def summarise_courses(columns: NPRColumns) -> List[dict]:
+    """Standard transformasjon: ett sammendrag per behandlingsserie (``BehSerieId``) med enkel validering."""
+    series = np.asarray(columns["BehSerieId"], dtype=str)
+    keys, group = np.unique(series, return_inverse=True)
+    group = group.reshape(-1)
+    count = np.bincount(group, minlength=len(keys))
+
+    inn, ut = columns["InnDato"], columns["UtDato"]
+    order = np.argsort(group, kind="stable")
+    starts = np.concatenate(([0], np.cumsum(count)[:-1]))
+    first_inn = np.minimum.reduceat(inn[order], starts)
+    last_ut = np.maximum.reduceat(ut[order], starts)
+
+    dose = columns["GittDose"]
+    missing_dose = np.bincount(group, weights=np.isnan(dose), minlength=len(keys))
+    total_dose = np.bincount(group, weights=np.nan_to_num(dose), minlength=len(keys))
+    invalid_interval = np.bincount(group, weights=inn > ut, minlength=len(keys))
+
+    plan_uids = columns["PlanUID"][order] if "PlanUID" in columns.columns else None
+    out = []
+    for i, key in enumerate(keys):
+        summary = {
+            "BehSerieId": str(key),
+            "contacts": int(count[i]),
+            "first_inn_dato": first_inn[i].item(),
+            "last_ut_dato": last_ut[i].item(),
+            "total_dose_gy": float(total_dose[i]),
+            "missing_dose": int(missing_dose[i]),
+            "invalid_interval": int(invalid_interval[i]),
+        }
+        if plan_uids is not None:
+            summary["plan_uids"] = sorted(set(plan_uids[starts[i]:starts[i] + count[i]].tolist()))
+        out.append(summary)
+    return out
+
+
+def merge_summaries(a: dict, b: dict) -> dict:
+    """Slår sammen to delsammendrag fra ``summarise_courses`` for samme behandlingsserie (fra ulike batcher)."""
+    out = dict(a)
+    out["contacts"] = a["contacts"] + b["contacts"]
+    out["first_inn_dato"] = min(a["first_inn_dato"], b["first_inn_dato"])
+    out["last_ut_dato"] = max(a["last_ut_dato"], b["last_ut_dato"])
+    out["total_dose_gy"] = a["total_dose_gy"] + b["total_dose_gy"]
+    out["missing_dose"] = a["missing_dose"] + b["missing_dose"]
+    out["invalid_interval"] = a["invalid_interval"] + b["invalid_interval"]
+    if "plan_uids" in a or "plan_uids" in b:
+        out["plan_uids"] = sorted(set(a.get("plan_uids", [])) | set(b.get("plan_uids", [])))
+    return out
+
+
+# Antall batcher som kan ligge i kø per arbeidsprosess; begrenser delt minne som er i bruk samtidig
+PREFETCH = 2
+
+
+def _to_shared(table) -> Tuple[str, int]:
+    """Skriver tabellen som Arrow IPC-strøm til et nytt delt minnesegment. Produsenten lukker sin egen
+    tilknytning med en gang; arbeidsprosessen som leser segmentet fjerner det (``unlink``)."""
+    import pyarrow as pa
+
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    buffer = sink.getvalue()
+    shm = SharedMemory(create=True, size=max(buffer.size, 1))
+    try:
+        shm.buf[:buffer.size] = memoryview(buffer).cast("B")
+    except BaseException:
+        shm.close()
+        shm.unlink()
+        raise
+    name = shm.name
+    shm.close()
+    return name, buffer.size
+
+
+def _release(name: str):
+    try:
+        shm = SharedMemory(name=name)
+    except FileNotFoundError:
+        return
+    shm.close()
+    shm.unlink()
+
+
+def _transform_segment(view: memoryview, transform: Callable[[NPRColumns], List[dict]]) -> List[dict]:
+    """Leser Arrow-bufferet direkte fra delt minne uten kopi og transformerer batchen. Tabellen og kolonnene
+    (numeriske kolonner kan være visninger inn i segmentet) slippes når funksjonen returnerer."""
+    import pyarrow as pa
+
+    table = pa.ipc.open_stream(pa.py_buffer(view)).read_all()
+    columns = NPRColumns.from_arrow(table)
+    del table
+    return transform(columns)
+
+
+def _worker(index: int, inbox, outbox, transform: Callable[[NPRColumns], List[dict]],
+            merge: Optional[Callable[[dict, dict], dict]], key: str):
+    rows: List[dict] = []
+    merged: Dict[str, dict] = {}
+    error = None
+    while True:
+        message = inbox.get()
+        if message is None:
+            break
+        name, size = message
+        shm = SharedMemory(name=name)
+        view = shm.buf[:size]
+        try:
+            if error is None:
+                result = _transform_segment(view, transform)
+                if merge is None:
+                    rows.extend(result)
+                else:
+                    for row in result:
+                        k = str(row.get(key))
+                        merged[k] = merge(merged[k], row) if k in merged else row
+                del result
+        except Exception as exc:
+            # Fortsett å tømme køen, slik at produsenten ikke blir stående på en full kø. Tracebacken holder
+            # rammen til ``_transform_segment`` (og dermed visninger inn i segmentet) i live, så den droppes.
+            error = exc.with_traceback(None)
+        finally:
+            try:
+                # BufferError betyr at noe fortsatt refererer til segmentet (f.eks. en kolonne i resultatet);
+                # det rapporteres som feil i stedet for at minnet blir liggende stille
+                view.release()
+                shm.close()
+            except BufferError as exc:
+                error = error or exc
+            shm.unlink()
+    outbox.put((index, error if error is not None else rows + list(merged.values())))
+
+
+def parallel_transform(
+        batches: Iterable[NPRColumns],
+        transform: Callable[[NPRColumns], List[dict]] = summarise_courses,
+        workers: Optional[int] = None,
+        key: str = "BehSerieId",
+        merge: Optional[Callable[[dict, dict], dict]] = None,
+        prefetch: int = PREFETCH
+    ) -> List[dict]:
+    """Parallell NPR -> NORPREG-transformasjon
+
+    Hash-partisjonerer NPR-batcher på ``key`` over ``workers`` prosesser, slik at hver behandlingsserie
+    havner hos én og samme prosess. Batcher sendes som Arrow-buffere i delt minne i stedet for picklede
+    dicts, og hver prosess transformerer batchen straks den kommer og fjerner segmentet. Køene er begrenset
+    til ``prefetch`` batcher per prosess, så minnebruken er uavhengig av datasettets størrelse.
+
+    ``transform`` må være en funksjon på modulnivå. En behandlingsserie kan være spredt over flere batcher;
+    ``merge`` slår sammen to resultatrader med samme ``key`` (standard ``merge_summaries`` for
+    ``summarise_courses``, ellers legges radene etter hverandre). Resultatene sorteres på ``key``."""
+
+    workers = workers or os.cpu_count() or 1
+    if merge is None and transform is summarise_courses:
+        merge = merge_summaries
+    # Arbeiderne må dele ressurssporeren med denne prosessen, ellers rydder de bort delt minne ved avslutning
+    resource_tracker.ensure_running()
+    ctx = mp.get_context()
+    inboxes = [ctx.Queue(maxsize=prefetch) for _ in range(workers)]
+    outbox = ctx.Queue()
+    processes = [
+        ctx.Process(target=_worker, args=(i, inboxes[i], outbox, transform, merge, key), daemon=True)
+        for i in range(workers)
+    ]
+    for process in processes:
+        process.start()
+
+    sent = []
+    results = {}
+    try:
+        for batch in batches:
+            if not len(batch):
+                continue
+            partitions = partition_of(batch[key], workers)
+            for p in range(workers):
+                indices = np.flatnonzero(partitions == p)
+                if len(indices):
+                    name, size = _to_shared(batch.take(indices).to_arrow())
+                    sent.append(name)
+                    inboxes[p].put((name, size))
+        for inbox in inboxes:
+            inbox.put(None)
+        for _ in range(workers):
+            index, result = outbox.get()
+            if isinstance(result, Exception):
+                raise result
+            results[index] = result
+        for process in processes:
+            process.join()
+    except BaseException:
+        # Segmenter som ikke ble lest før feilen fjernes her; leste segmenter er allerede fjernet
+        for process in processes:
+            process.terminate()
+        for name in sent:
+            _release(name)
+        raise
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+    merged = [row for index in sorted(results) for row in results[index]]
+    return sorted(merged, key=lambda row: str(row.get(key)))
@@ -0,0 +1,130 @@
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .RT import Plan
+from .fraction_tracker import FractionTracker, fraction_key
+from .utils import parse_decimal
+
+
+def _get(row, name):
+    return row[name] if isinstance(row, dict) else getattr(row, name)
+
+
+class _Accumulator:
+    """Løpende antall, dosesum og min/maks for leverte fraksjoner fra én datakilde."""
+
+    def __init__(self):
+        self.entries: Dict[object, Tuple[Optional[int], Optional[datetime], float]] = {}
+        self.dose = 0.0
+        self.number_range: Tuple[Optional[int], Optional[int]] = (None, None)
+        self.time_range: Tuple[Optional[datetime], Optional[datetime]] = (None, None)
+        self._stale = False
+
+    @staticmethod
+    def _extend(current, value):
+        if value is None:
+            return current
+        low, high = current
+        return (value if low is None or value < low else low, value if high is None or value > high else high)
+
+    def add(self, key, number: Optional[int], time: Optional[datetime], dose: Optional[float]) -> bool:
+        entry = (number, time, dose or 0.0)
+        previous = self.entries.get(key)
+        if previous == entry:
+            return False
+        if previous is not None:
+            self.dose -= previous[2]
+            # Min/maks kan ikke trekkes fra, så de beregnes på nytt ved neste uthenting
+            self._stale = True
+        self.entries[key] = entry
+        self.dose += entry[2]
+        if not self._stale:
+            self.number_range = self._extend(self.number_range, number)
+            self.time_range = self._extend(self.time_range, time)
+        return True
+
+    def ranges(self):
+        if self._stale:
+            self.number_range = self.time_range = (None, None)
+            for number, time, _ in self.entries.values():
+                self.number_range = self._extend(self.number_range, number)
+                self.time_range = self._extend(self.time_range, time)
+            self._stale = False
+        return self.number_range, self.time_range
+
+
+class PlanAggregator:
+    """Inkrementell aggregering av leverte fraksjoner per plan
+       =======================================================
+
+        Tar imot ``RT.Fraction``- og ``NPR.NPR``-rader som en strøm og holder løpende antall, dosesum og
+        min/maks fraksjonsnummer og -tidspunkt per plan UID. ``flush`` returnerer ``RT.Plan``-objekter kun for
+        planer som er endret siden forrige kall, med kun de endrede feltene satt (``model_fields_set``).
+
+        RT Record brukes som kilde for levert dose når den finnes for planen, ellers NPR. RT Record-fraksjoner
+        identifiseres som i ``FractionTracker`` (plan UID og ``fx_number``, se ``fraction_key``), og
+        ``plan_completion`` beregnes av ``FractionTracker.plan_completion``; planlagt dose settes med
+        ``set_planned`` eller deles ved å gi samme ``tracker`` til begge."""
+
+    def __init__(self, tracker: Optional[FractionTracker] = None):
+        self.tracker = tracker or FractionTracker()
+        self.rtrecord: Dict[str, _Accumulator] = {}
+        self.npr: Dict[str, _Accumulator] = {}
+        self.emitted: Dict[str, dict] = {}
+        self.dirty = set()
+
+    def set_planned(self, plan_uid: str, total_dose_planned: Optional[float]):
+        if total_dose_planned is not None and self.tracker.total_dose_planned.get(plan_uid) != total_dose_planned:
+            self.tracker.set_planned(plan_uid, total_dose_planned=total_dose_planned)
+            self.dirty.add(plan_uid)
+
+    def add_fraction(self, fraction, record_key: Optional[str] = None):
+        plan_uid = _get(fraction, "fx_plan_uid")
+        number, time = _get(fraction, "fx_number"), _get(fraction, "fx_datetime")
+        accumulator = self.rtrecord.setdefault(plan_uid, _Accumulator())
+        if accumulator.add(fraction_key(number, time, record_key), number, time, _get(fraction, "fx_dose_delivered")):
+            self.dirty.add(plan_uid)
+
+    def add_npr(self, row):
+        plan_uid = _get(row, "PlanUID")
+        accumulator = self.npr.setdefault(plan_uid, _Accumulator())
+        if accumulator.add(_get(row, "Kno"), None, _get(row, "InnDato"), parse_decimal(_get(row, "GittDose"))):
+            self.dirty.add(plan_uid)
+
+    def consume(self, fractions: Iterable = (), npr_rows: Iterable = ()):
+        for fraction in fractions:
+            self.add_fraction(fraction)
+        for row in npr_rows:
+            self.add_npr(row)
+
+    def _values(self, plan_uid: str) -> dict:
+        if plan_uid in self.rtrecord:
+            source, accumulator = "RTRECORD", self.rtrecord[plan_uid]
+        elif plan_uid in self.npr:
+            source, accumulator = "NPR", self.npr[plan_uid]
+        else:
+            return {}
+        (number_from, number_to), (time_from, time_to) = accumulator.ranges()
+        return {
+            "fxs_delivered": len(accumulator.entries),
+            "total_dose_delivered": accumulator.dose,
+            "fx_delivered_from": number_from,
+            "fx_delivered_to": number_to,
+            "fx_delivered_from_datetime": time_from,
+            "fx_delivered_to_datetime": time_to,
+            "plan_completion": self.tracker.plan_completion(plan_uid, accumulator.dose),
+            "plan_delivered_source": source,
+        }
+
+    def flush(self) -> List[Plan]:
+        """Returnerer endringer (deltaer) for planer som er oppdatert siden forrige kall."""
+        deltas = []
+        for plan_uid in sorted(self.dirty, key=str):
+            values = self._values(plan_uid)
+            previous = self.emitted.get(plan_uid, {})
+            changed = {k: v for k, v in values.items() if k not in previous or previous[k] != v}
+            if changed:
+                self.emitted[plan_uid] = values
+                deltas.append(Plan.model_construct(_fields_set={"plan_uid", *changed}, plan_uid=plan_uid, **changed))
+        self.dirty.clear()
+        return deltas
@@ -0,0 +1,155 @@
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+from .Strukturer import Plan
+from .dvh import BIN_WIDTH, differential, cumulative_from_differential, doses_at_volumes, dvh_matrix, dvh_metrics, metric_rows
+
+# Sannsynlighetsgitter for kvantilsummering (komonoton metode)
+QUANTILES = 2000
+
+
+class PlanSum(NamedTuple):
+    """Kumulative plansum-DVH-er (S, B) med garanterte nedre/øvre grenser."""
+    names: List[str]
+    cumulative: np.ndarray
+    lower: np.ndarray
+    upper: np.ndarray
+    volumes_cc: np.ndarray
+    bin_width: float
+
+    @property
+    def max_error(self) -> np.ndarray:
+        """Største bredde på grensene per struktur (andel av volumet)."""
+        return (self.upper - self.lower).max(axis=1) if self.cumulative.size else np.zeros(len(self.names))
+
+
+def plan_sum_exact(
+        doses: Sequence[np.ndarray],
+        labels: np.ndarray,
+        structures: int,
+        voxel_volumes: Optional[np.ndarray] = None,
+        bin_width: float = BIN_WIDTH
+    ) -> np.ndarray:
+    """Eksakt plansum når voksel-dosene er kjent
+
+    ``doses`` har én dosevektor per plan for de samme vokslene (samme rekkefølge), ``labels`` angir struktur-
+    indeksen til hver voksel (en voksel som hører til flere strukturer gjentas). Alle strukturer histogrammeres
+    i én ``bincount`` over (struktur, dosebin)."""
+    total = np.sum([np.asarray(d, dtype=float) for d in doses], axis=0)
+    labels = np.asarray(labels, dtype=np.int64)
+    weights = np.ones(len(total)) if voxel_volumes is None else np.asarray(voxel_volumes, dtype=float)
+    bins = int(np.floor(total.max() / bin_width)) + 2 if len(total) else 1
+    index = np.floor(total / bin_width).astype(np.int64)
+    counts = np.bincount(labels * bins + index, weights=weights, minlength=structures * bins).reshape(structures, bins)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        diff = np.nan_to_num(counts / counts.sum(axis=1, keepdims=True))
+    return cumulative_from_differential(diff)
+
+
+def _pad(matrix: np.ndarray, bins: int) -> np.ndarray:
+    return np.pad(matrix, ((0, 0), (0, bins - matrix.shape[1])))
+
+
+def makarov_bounds(lower_a: np.ndarray, upper_a: np.ndarray, b: np.ndarray):
+    """Garanterte grenser for P(A + B >= k * bw) gitt kumulative DVH-er for A (med grenser) og B
+
+    Uavhengig av hvordan dosene i de to planene samvarierer i hver voksel:
+    max_i V_A(i) + V_B(k - i) - 1 <= V(k) <= min_i V_A(i) + V_B(k - i)."""
+    s = len(b)
+    bins = upper_a.shape[1] + b.shape[1] - 1
+    lower = np.zeros((s, bins))
+    upper = np.full((s, bins), np.inf)
+    lower_a, upper_a, b = _pad(lower_a, bins), _pad(upper_a, bins), _pad(b, bins)
+    # Kanter utenfor aksen: V(0) = 1, ellers 0 (allerede polstret)
+    for i in range(bins):
+        width = bins - i
+        lower[:, i:] = np.maximum(lower[:, i:], lower_a[:, i:i + 1] + b[:, :width] - 1)
+        upper[:, i:] = np.minimum(upper[:, i:], upper_a[:, i:i + 1] + b[:, :width])
+    return np.clip(lower, 0.0, 1.0), np.clip(upper, 0.0, 1.0)
+
+
+def _independent(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Sum av uavhengige doser: konvolusjon av differensielle DVH-er (FFT, alle strukturer samtidig)."""
+    bins = a.shape[1] + b.shape[1] - 1
+    size = 1 << int(np.ceil(np.log2(bins)))
+    spectrum = np.fft.rfft(differential(a), size, axis=1) * np.fft.rfft(differential(b), size, axis=1)
+    diff = np.clip(np.fft.irfft(spectrum, size, axis=1)[:, :bins], 0.0, None)
+    return cumulative_from_differential(diff)
+
+
+def _comonotonic(a: np.ndarray, b: np.ndarray, bin_width: float) -> np.ndarray:
+    """Sum av komonotone doser (høyeste dose i plan A i samme voksler som høyeste dose i plan B):
+    kvantilene adderes. Gir typisk best anslag for replan/boost på samme målvolum."""
+    p = (np.arange(QUANTILES) + 0.5) / QUANTILES
+    bins = a.shape[1] + b.shape[1] - 1
+    quantiles = np.nan_to_num(doses_at_volumes(a, p, bin_width)) + np.nan_to_num(doses_at_volumes(b, p, bin_width))
+    index = np.clip(np.floor(quantiles / bin_width + 1e-9).astype(np.int64), 0, bins - 1)
+    rows = np.repeat(np.arange(len(a)), QUANTILES)
+    counts = np.bincount(rows * bins + index.ravel(), minlength=len(a) * bins).reshape(len(a), bins)
+    return cumulative_from_differential(counts / QUANTILES)
+
+
+def plan_sum_dvh(
+        cumulatives: Sequence[np.ndarray],
+        method: str = "comonotonic",
+        bin_width: float = BIN_WIDTH
+    ):
+    """Plansum fra DVH-er alene, for alle strukturer samtidig
+
+    ``cumulatives`` har én (S, B)-matrise per plan med samme strukturrekkefølge. ``method`` er
+    "comonotonic" (kvantiladdisjon) eller "independent" (konvolusjon). I tillegg gis garanterte grenser
+    (Makarov) som gjelder for enhver romlig fordeling av dosene, slik at feilen i anslaget er begrenset
+    av ``upper - lower`` (pluss én bin for diskretiseringen)."""
+    if method not in ("comonotonic", "independent"):
+        raise ValueError(f"Ukjent metode for plansum: {method}")
+    estimate = lower = upper = cumulatives[0]
+    for b in cumulatives[1:]:
+        lower, upper = makarov_bounds(lower, upper, b)
+        estimate = _comonotonic(estimate, b, bin_width) if method == "comonotonic" else _independent(estimate, b)
+        bins = upper.shape[1]
+        estimate = np.clip(_pad(estimate, bins)[:, :bins], lower, upper)
+    return estimate, lower, upper
+
+
+def plan_sum_from_plans(
+        plans: Sequence[Plan],
+        structures: Optional[Sequence[str]] = None,
+        method: str = "comonotonic",
+        bin_width: float = BIN_WIDTH
+    ) -> PlanSum:
+    """Plansum for strukturer som finnes i alle planene (eller de angitte ``structures``), koblet på navn.
+
+    Volumet hentes fra første plan."""
+    if structures is None:
+        common = set(plans[0].structure_names)
+        for plan in plans[1:]:
+            common &= set(plan.structure_names)
+        structures = [name for name in plans[0].structure_names if name in common]
+
+    matrices = []
+    for plan in plans:
+        position = {name: i for i, name in enumerate(plan.structure_names)}
+        try:
+            picked = [position[name] for name in structures]
+        except KeyError as exc:
+            raise KeyError(f"Struktur {exc.args[0]} mangler i plan {plan.plan_uid}") from None
+        matrices.append(dvh_matrix(
+            [plan.dvh_doses_gy_nested[i] for i in picked],
+            [plan.dvh_relative_volumes_nested[i] for i in picked],
+            bin_width
+        ))
+    first = {name: i for i, name in enumerate(plans[0].structure_names)}
+    volumes = np.array([plans[0].structure_volumes[first[name]] for name in structures], dtype=float)
+    estimate, lower, upper = plan_sum_dvh(matrices, method, bin_width)
+    return PlanSum(list(structures), estimate, lower, upper, volumes, bin_width)
+
+
+def plan_sum_rows(plan_sum: PlanSum, prescription_gy: Optional[float] = None) -> List[dict]:
+    """``RT.DVH``-felt for plansummen (``is_dvh_plan_sum=True``), én rad per struktur."""
+    prescription = None if prescription_gy is None else np.full(len(plan_sum.names), prescription_gy)
+    metrics = dvh_metrics(plan_sum.cumulative, plan_sum.volumes_cc, prescription, plan_sum.bin_width)
+    rows = metric_rows(metrics)
+    for row, name, volume in zip(rows, plan_sum.names, plan_sum.volumes_cc.tolist()):
+        row.update(roi_name=name, volume=volume, is_dvh_plan_sum=True)
+    return rows
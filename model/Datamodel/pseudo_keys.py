@@ -0,0 +1,204 @@
+import os
+import secrets
+import struct
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Iterable, List, Optional, Union
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+KEY_BITS = 28
+KEY_SPACE = 1 << KEY_BITS
+BITMAP_BYTES = KEY_SPACE // 8
+
+# Antall tilfeldige trekk før vi leter lineært etter ledig nøkkel
+MAX_RANDOM_DRAWS = 16
+
+# Hver tildeling logges som 4 byte (little-endian); loggen slås inn i bitmapet når den passerer denne størrelsen
+LOG_RECORD = 4
+COMPACT_LOG_BYTES = 16 << 20
+
+
+def format_key(key: int) -> str:
+    """Formaterer en nøkkel som 7-karakter heksadesimal (f.eks. a72bf40)."""
+    return f"{key:07x}"
+
+
+def parse_key(key: Union[str, int]) -> int:
+    value = int(key, 16) if isinstance(key, str) else int(key)
+    if not 0 <= value < KEY_SPACE:
+        raise ValueError(f"Nøkkel utenfor 7-karakter heksadesimalt område: {key!r}")
+    return value
+
+
+class KeyAllocator:
+    """Tildeling av pseudonymiserte nøkler
+       ===================================
+
+        Holder et bitmap over brukte nøkler i hele 2^28-rommet (32 MiB) for ``record_id`` / ``pseudo_key``.
+        Nye nøkler trekkes tilfeldig og sjekkes mot bitmapet, så kostnaden er O(antall nøkler) uavhengig
+        av hvor mange som er brukt fra før. Dersom ``path`` er angitt skrives nye nøkler til en logg ved siden
+        av bitmapet (``path + ".log"``), slik at hver tildeling koster O(antall nøkler) på disk. Loggen slås inn
+        i bitmapet (atomisk) når den blir stor. En fillås sørger for at flere innlesingsprosesser kan dele
+        samme bitmap; hver prosess leser bare loggen som er skrevet siden sist."""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.log_path = path and path + ".log"
+        self.bitmap = bytearray(BITMAP_BYTES)
+        self.used = 0
+        self._lock = threading.Lock()
+        self._stamp = None
+        self._log_offset = 0
+        if path and (os.path.exists(path) or os.path.exists(self.log_path)):
+            self._load()
+
+    def _file_stamp(self):
+        if not os.path.exists(self.path):
+            return None
+        st = os.stat(self.path)
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def _load(self):
+        if os.path.exists(self.path):
+            with open(self.path, "rb") as f:
+                data = f.read()
+            if len(data) != BITMAP_BYTES:
+                raise ValueError(f"Ugyldig størrelse på nøkkelbitmap {self.path}: {len(data)} bytes")
+            self.bitmap = bytearray(data)
+        else:
+            self.bitmap = bytearray(BITMAP_BYTES)
+        self.used = int.from_bytes(self.bitmap, "little").bit_count()
+        self._stamp = self._file_stamp()
+        self._log_offset = 0
+        self._replay()
+
+    def _replay(self):
+        """Leser loggposter skrevet etter ``_log_offset`` (av denne eller andre prosesser)."""
+        if not os.path.exists(self.log_path):
+            self._log_offset = 0
+            return
+        with open(self.log_path, "rb") as f:
+            f.seek(self._log_offset)
+            data = f.read()
+        # En avbrutt skriving kan etterlate en ufullstendig post til slutt; den hoppes over
+        complete = len(data) - len(data) % LOG_RECORD
+        for (value,) in struct.iter_unpack("<I", data[:complete]):
+            self._set(value)
+        self._log_offset += complete
+
+    def _append(self, values: List[int]):
+        with open(self.log_path, "ab") as f:
+            size = f.tell()
+            if size % LOG_RECORD:
+                f.truncate(size - size % LOG_RECORD)
+                f.seek(0, os.SEEK_END)
+            f.write(struct.pack(f"<{len(values)}I", *values))
+            f.flush()
+            os.fsync(f.fileno())
+            self._log_offset = f.tell()
+        if self._log_offset >= COMPACT_LOG_BYTES:
+            self.compact()
+
+    def compact(self):
+        """Skriver hele bitmapet atomisk og tømmer loggen. Kalles med fillåsen holdt."""
+        if not self.path:
+            return
+        self._save()
+        with open(self.log_path, "wb") as f:
+            os.fsync(f.fileno())
+        self._log_offset = 0
+
+    def _save(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".keys-", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(self.bitmap)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        self._stamp = self._file_stamp()
+
+    @contextmanager
+    def _locked(self):
+        with self._lock:
+            if not self.path:
+                yield
+                return
+            with open(self.path + ".lock", "a+b") as lock_file:
+                if fcntl:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+                else:
+                    lock_file.seek(0)
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+                try:
+                    # Andre prosesser kan ha tildelt nøkler (logg) eller komprimert (nytt bitmap) siden sist
+                    if self._file_stamp() != self._stamp:
+                        self._load()
+                    else:
+                        self._replay()
+                    yield
+                finally:
+                    if fcntl:
+                        fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+                    else:
+                        lock_file.seek(0)
+                        msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def is_used(self, key: Union[str, int]) -> bool:
+        value = parse_key(key)
+        return bool(self.bitmap[value >> 3] & (1 << (value & 7)))
+
+    def _set(self, value: int) -> bool:
+        byte, bit = value >> 3, 1 << (value & 7)
+        if self.bitmap[byte] & bit:
+            return False
+        self.bitmap[byte] |= bit
+        self.used += 1
+        return True
+
+    def _next_free(self, start: int) -> int:
+        bitmap = self.bitmap
+        for i in range(BITMAP_BYTES):
+            byte = (start + i) % BITMAP_BYTES
+            if bitmap[byte] != 0xFF:
+                free = ~bitmap[byte] & 0xFF
+                return (byte << 3) | ((free & -free).bit_length() - 1)
+        raise RuntimeError("Ingen ledige nøkler igjen")
+
+    def mark_used(self, keys: Iterable[Union[str, int]]) -> int:
+        """Registrerer eksisterende nøkler (f.eks. fra databasen). Returnerer antall nye."""
+        with self._locked():
+            added = [value for value in map(parse_key, keys) if self._set(value)]
+            if added and self.path:
+                self._append(added)
+        return len(added)
+
+    def allocate(self, count: int = 1) -> List[str]:
+        """Tildeler ``count`` nye, unike nøkler som 7-karakter heksadesimale strenger."""
+        with self._locked():
+            if self.used + count > KEY_SPACE:
+                raise RuntimeError(f"Kan ikke tildele {count} nøkler, {KEY_SPACE - self.used} ledige")
+            values = []
+            for _ in range(count):
+                for _ in range(MAX_RANDOM_DRAWS):
+                    value = secrets.randbits(KEY_BITS)
+                    if self._set(value):
+                        break
+                else:
+                    value = self._next_free(secrets.randbits(KEY_BITS) >> 3)
+                    self._set(value)
+                values.append(value)
+            if values and self.path:
+                self._append(values)
+        return [format_key(value) for value in values]
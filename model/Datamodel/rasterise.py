@@ -0,0 +1,329 @@
+import hashlib
+import os
+import tempfile
+from collections import OrderedDict
+from typing import Hashable, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+class Grid(NamedTuple):
+    """Regulært voksel-gitter: senter i første voksel (x, y, z), avstand (dx, dy, dz) i mm og form (nz, ny, nx)."""
+    origin: Tuple[float, float, float]
+    spacing: Tuple[float, float, float]
+    shape: Tuple[int, int, int]
+
+    def refined(self, factor: int) -> "Grid":
+        """Samme gitter med ``factor`` ganger finere oppløsning i snittplanet (supersampling)."""
+        if factor == 1:
+            return self
+        (x0, y0, z0), (dx, dy, dz), (nz, ny, nx) = self.origin, self.spacing, self.shape
+        return Grid(
+            (x0 - dx / 2 + dx / factor / 2, y0 - dy / 2 + dy / factor / 2, z0),
+            (dx / factor, dy / factor, dz),
+            (nz, ny * factor, nx * factor),
+        )
+
+    @property
+    def voxel_cc(self) -> float:
+        dx, dy, dz = self.spacing
+        return dx * dy * dz / 1000
+
+
+class Mask(NamedTuple):
+    """Binær maske innenfor strukturens omsluttende boks. ``offset`` er (k, j, i) for første voksel i boksen."""
+    offset: Tuple[int, int, int]
+    data: np.ndarray
+
+    def indices(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        k, j, i = np.nonzero(self.data)
+        return k + self.offset[0], j + self.offset[1], i + self.offset[2]
+
+    def count(self) -> int:
+        return int(np.count_nonzero(self.data))
+
+
+def structure_contours(plan, index: int):
+    """Flate x/y/z-vektorer og startindeks for hver kontur for struktur ``index`` i ``Strukturer.Plan``."""
+    x = np.asarray(plan.roi_coords_x_mm_nested[index], dtype=float)
+    y = np.asarray(plan.roi_coords_y_mm_nested[index], dtype=float)
+    z = np.asarray(plan.roi_coords_z_mm_nested[index], dtype=float)
+    offsets = np.asarray(plan.roi_coords_offsets_nested[index], dtype=np.int64)
+    return x, y, z, offsets
+
+
+def _edges(x: np.ndarray, y: np.ndarray, offsets: np.ndarray):
+    """Alle polygonkanter (start- og sluttpunkt) og hvilken kontur de tilhører, lukket per kontur."""
+    n = len(x)
+    starts = np.asarray(offsets, dtype=np.int64)
+    ends = np.append(starts[1:], n)
+    contour = np.repeat(np.arange(len(starts)), ends - starts)
+    following = np.arange(1, n + 1)
+    following[ends[ends > starts] - 1] = starts[ends > starts]
+    return x, y, x[following], y[following], contour
+
+
+def rasterise(x: np.ndarray, y: np.ndarray, z: np.ndarray, offsets: np.ndarray, grid: Grid) -> Optional[Mask]:
+    """Rasteriserer konturene til en binær maske på ``grid`` med vektorisert scanline-fylling
+
+    Hver kontur er et lukket polygon i sitt z-snitt. Hvert dosesnitt får konturene fra nærmeste struktursnitt
+    (innenfor halve snittavstanden). Skjæringspunkter mellom kanter og voksel-radene beregnes for alle kanter
+    samtidig og markeres som vekslinger; innsiden følger av kumulativ paritet langs x (even-odd-regelen, slik
+    at indre konturer blir hull). Gir ``None`` dersom strukturen faller utenfor gitteret."""
+
+    (x0, y0, z0), (dx, dy, dz), (nz, ny, nx) = grid
+    if not len(x) or not len(offsets):
+        return None
+    x1, y1, x2, y2, contour = _edges(x, y, offsets)
+
+    # Koble dosesnitt mot nærmeste struktursnitt
+    contour_z = z[np.asarray(offsets, dtype=np.int64)]
+    levels = np.unique(contour_z)
+    thickness = np.median(np.diff(levels)) if len(levels) > 1 else abs(dz)
+    slice_z = z0 + np.arange(nz) * dz
+    position = np.searchsorted(levels, slice_z)
+    below = np.clip(position - 1, 0, len(levels) - 1)
+    above = np.clip(position, 0, len(levels) - 1)
+    nearest = np.where(np.abs(levels[below] - slice_z) <= np.abs(levels[above] - slice_z), below, above)
+    valid = np.abs(levels[nearest] - slice_z) <= thickness / 2 + 1e-6
+    slices = np.flatnonzero(valid)
+    if not len(slices):
+        return None
+    order = np.argsort(nearest[slices], kind="stable")
+    slice_sorted, level_sorted = slices[order], nearest[slices][order]
+    per_level = np.bincount(level_sorted, minlength=len(levels))
+    first_slice = np.concatenate(([0], np.cumsum(per_level)[:-1]))
+
+    # Gjenta hver kant for hvert dosesnitt som bruker kantens struktursnitt
+    edge_level = np.searchsorted(levels, contour_z[contour])
+    repeats = per_level[edge_level]
+    edge = np.repeat(np.arange(len(x1)), repeats)
+    within = np.arange(len(edge)) - np.repeat(np.cumsum(repeats) - repeats, repeats)
+    k = slice_sorted[first_slice[edge_level[edge]] + within]
+    x1, y1, x2, y2 = x1[edge], y1[edge], x2[edge], y2[edge]
+
+    # Radene (voksel-sentre i y) som hver kant krysser, halvåpent intervall [ymin, ymax)
+    low, high = np.minimum(y1, y2), np.maximum(y1, y2)
+    row_from = np.maximum(np.ceil((low - y0) / dy - 1e-9).astype(np.int64), 0)
+    row_to = np.minimum(np.ceil((high - y0) / dy - 1e-9).astype(np.int64), ny)
+    rows = np.maximum(row_to - row_from, 0)
+    if not rows.sum():
+        return None
+    crossing = np.repeat(np.arange(len(x1)), rows)
+    row = row_from[crossing] + np.arange(len(crossing)) - np.repeat(np.cumsum(rows) - rows, rows)
+    yr = y0 + row * dy
+    t = (yr - y1[crossing]) / (y2[crossing] - y1[crossing])
+    xc = x1[crossing] + t * (x2[crossing] - x1[crossing])
+    column = np.clip(np.ceil((xc - x0) / dx - 1e-9).astype(np.int64), 0, nx)
+    k = k[crossing]
+
+    # Omsluttende boks og paritet for vekslingene
+    k0, j0 = int(k.min()), int(row.min())
+    i0 = int(column.min())
+    i1 = int(column.max())
+    if i1 <= i0:
+        return None
+    shape = (int(k.max()) - k0 + 1, int(row.max()) - j0 + 1, i1 - i0 + 1)
+    flat = ((k - k0) * shape[1] + (row - j0)) * shape[2] + (column - i0)
+    toggles = (np.bincount(flat, minlength=shape[0] * shape[1] * shape[2]) & 1).astype(np.uint8).reshape(shape)
+    inside = (np.cumsum(toggles, axis=2, dtype=np.uint8) & 1).astype(bool)[:, :, :-1]
+    # Kolonner forbi gitteret (indeks nx) er kun vekslinger
+    inside = inside[:, :, :max(min(nx - i0, inside.shape[2]), 0)]
+    return Mask((k0, j0, i0), inside)
+
+
+class MaskCache:
+    """LRU-cache for voksel-masker, nøkkel f.eks. (plan_uid, struktur, gitter, supersampling)."""
+
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = maxsize
+        self.entries: "OrderedDict[Hashable, Optional[Mask]]" = OrderedDict()
+
+    def get(self, key: Hashable):
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return self.entries[key]
+        raise KeyError(key)
+
+    def put(self, key: Hashable, mask: Optional[Mask]):
+        self.entries[key] = mask
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.entries
+
+
+def outside_grid(x: np.ndarray, y: np.ndarray, z: np.ndarray, grid: Grid) -> bool:
+    """Sann dersom noen konturpunkter ligger utenfor gitteret (``RT.DVH.outside_dose_volume``)."""
+    (x0, y0, z0), (dx, dy, dz), (nz, ny, nx) = grid
+    for values, start, step, n in ((x, x0, dx, nx), (y, y0, dy, ny), (z, z0, dz, nz)):
+        if len(values):
+            low, high = sorted((start - step / 2, start + (n - 0.5) * step))
+            if values.min() < low or values.max() > high:
+                return True
+    return False
+
+
+class PackedMask(NamedTuple):
+    """Bit-pakket maske. Rader (k, j) innenfor boksen, hele gitterbredden langs x pakket til bits, slik at
+    masker på samme gitter kan kombineres bitvis uten utpakking."""
+    offset: Tuple[int, int]
+    bits: np.ndarray
+    nx: int
+    voxel_cc: float
+
+    @classmethod
+    def pack(cls, mask: Optional[Mask], grid: Grid) -> "PackedMask":
+        nx = grid.shape[2]
+        if mask is None:
+            return cls((0, 0), np.zeros((0, 0, (nx + 7) // 8), dtype=np.uint8), nx, grid.voxel_cc)
+        k0, j0, i0 = mask.offset
+        rows = np.zeros(mask.data.shape[:2] + (nx,), dtype=bool)
+        rows[:, :, i0:i0 + mask.data.shape[2]] = mask.data
+        return cls((k0, j0), np.packbits(rows, axis=2), nx, grid.voxel_cc)
+
+    def unpack(self) -> Mask:
+        return Mask(self.offset + (0,), np.unpackbits(self.bits, axis=2, count=self.nx).astype(bool))
+
+    def count(self) -> int:
+        return int(POPCOUNT[self.bits].sum(dtype=np.int64))
+
+    @property
+    def volume_cc(self) -> float:
+        return self.count() * self.voxel_cc
+
+    def _aligned(self, other: "PackedMask", union: bool):
+        """Begge masker på felles (k, j)-område: snittet av boksene, eller den omsluttende boksen."""
+        if self.nx != other.nx:
+            raise ValueError("Maskene er ikke på samme gitter")
+        (ak, aj), (bk, bj) = self.offset, other.offset
+        a_end = (ak + self.bits.shape[0], aj + self.bits.shape[1])
+        b_end = (bk + other.bits.shape[0], bj + other.bits.shape[1])
+        pick = (min, max) if union else (max, min)
+        k0, j0 = pick[0](ak, bk), pick[0](aj, bj)
+        k1, j1 = pick[1](a_end[0], b_end[0]), pick[1](a_end[1], b_end[1])
+        shape = (max(k1 - k0, 0), max(j1 - j0, 0), self.bits.shape[2])
+
+        def place(mask, k, j):
+            out = np.zeros(shape, dtype=np.uint8)
+            ks, js = max(k0 - k, 0), max(j0 - j, 0)
+            ke, je = min(k1 - k, mask.bits.shape[0]), min(j1 - j, mask.bits.shape[1])
+            if ke > ks and je > js:
+                out[ks + k - k0:ke + k - k0, js + j - j0:je + j - j0] = mask.bits[ks:ke, js:je]
+            return out
+
+        return (k0, j0), place(self, ak, aj), place(other, bk, bj)
+
+    def __and__(self, other: "PackedMask") -> "PackedMask":
+        offset, a, b = self._aligned(other, union=False)
+        return PackedMask(offset, a & b, self.nx, self.voxel_cc)
+
+    def __or__(self, other: "PackedMask") -> "PackedMask":
+        offset, a, b = self._aligned(other, union=True)
+        return PackedMask(offset, a | b, self.nx, self.voxel_cc)
+
+    def __sub__(self, other: "PackedMask") -> "PackedMask":
+        offset, a, b = self._aligned(other, union=True)
+        return PackedMask(offset, a & ~b, self.nx, self.voxel_cc)
+
+    def intersection_cc(self, other: "PackedMask") -> float:
+        return (self & other).volume_cc
+
+
+def union(masks: Sequence[PackedMask]) -> Optional[PackedMask]:
+    result = None
+    for mask in masks:
+        result = mask if result is None else result | mask
+    return result
+
+
+def pairwise_overlap_cc(masks: Sequence[PackedMask]) -> np.ndarray:
+    """Overlappvolum (cc) mellom alle par av strukturer; diagonalen er strukturvolumet."""
+    n = len(masks)
+    out = np.zeros((n, n))
+    for a in range(n):
+        out[a, a] = masks[a].volume_cc
+        for b in range(a + 1, n):
+            out[a, b] = out[b, a] = masks[a].intersection_cc(masks[b])
+    return out
+
+
+def _grid_key(grid: Grid) -> str:
+    return repr((tuple(map(float, grid.origin)), tuple(map(float, grid.spacing)), tuple(map(int, grid.shape))))
+
+
+class MaskStore:
+    """Maskelager på disk
+       ==================
+
+        Bit-pakkede masker nøkkelet på (``plan_uid``, strukturindeks, gitter) som .npz-filer i ``directory``, med
+        en LRU-cache i minnet foran. Strukturer identifiseres med indeksen i ``Strukturer.Plan``, siden to
+        strukturer i samme plan kan ha samme navn. Nye masker rasteriseres ved behov og skrives atomisk; uten
+        ``plan_uid`` lagres ikke masken."""
+
+    def __init__(self, directory: str, cache_size: int = 1024):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.memory = MaskCache(cache_size)
+
+    def _path(self, plan_uid: str, index: int, grid: Grid) -> str:
+        digest = hashlib.sha1(f"{plan_uid}\x1f{int(index)}\x1f{_grid_key(grid)}".encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, digest[:2], digest + ".npz")
+
+    def get(self, plan_uid: str, index: int, grid: Grid) -> Optional[PackedMask]:
+        key = (plan_uid, index, grid)
+        if key in self.memory:
+            return self.memory.get(key)
+        path = self._path(plan_uid, index, grid)
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            mask = PackedMask(tuple(int(v) for v in data["offset"]), data["bits"], int(data["nx"]), float(data["voxel_cc"]))
+        self.memory.put(key, mask)
+        return mask
+
+    def put(self, plan_uid: str, index: int, grid: Grid, mask: PackedMask):
+        path = self._path(plan_uid, index, grid)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".npz")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, offset=np.array(mask.offset), bits=mask.bits, nx=mask.nx, voxel_cc=mask.voxel_cc)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        self.memory.put((plan_uid, index, grid), mask)
+
+    def mask(self, plan, index: int, grid: Grid) -> PackedMask:
+        """Maske for struktur ``index`` i ``Strukturer.Plan``, fra lageret eller rasterisert og lagret."""
+        mask = self.get(plan.plan_uid, index, grid) if plan.plan_uid is not None else None
+        if mask is None:
+            x, y, z, offsets = structure_contours(plan, index)
+            mask = PackedMask.pack(rasterise(x, y, z, offsets, grid), grid)
+            if plan.plan_uid is not None:
+                self.put(plan.plan_uid, index, grid, mask)
+        return mask
+
+    def plan_masks(self, plan, grid: Grid) -> List[PackedMask]:
+        return [self.mask(plan, index, grid) for index in range(len(plan.structure_names))]
+
+
+def ptv_overlap(plan, grid: Grid, store: MaskStore, target_types: Sequence[str] = ("PTV",)) -> List[dict]:
+    """``ptv_overlap`` (overlapp med union av PTV, cc) og ``outside_dose_volume`` per struktur i planen, i samme
+    rekkefølge som ``structure_names`` og med strukturnavnet som ``roi_name``."""
+    masks = store.plan_masks(plan, grid)
+    targets = union([m for m, kind in zip(masks, plan.structure_types) if kind.upper() in target_types])
+    out = []
+    for index, (name, mask) in enumerate(zip(plan.structure_names, masks)):
+        x, y, z, _ = structure_contours(plan, index)
+        out.append({
+            "roi_name": name,
+            "ptv_overlap": mask.intersection_cc(targets) if targets is not None else None,
+            "outside_dose_volume": outside_grid(x, y, z, grid),
+        })
+    return out
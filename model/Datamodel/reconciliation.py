@@ -0,0 +1,116 @@
+import heapq
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import timedelta
+from typing import Dict, Iterable, List, Optional
+
+from .utils import parse_decimal
+
+
+def _get(row, name):
+    return row[name] if isinstance(row, dict) else getattr(row, name)
+
+
+@dataclass
+class FractionMatch:
+    """Én NPR-kontakt med fraksjonene som ble koblet til den. ``dose_diff`` er ``GittDose`` minus summen av
+    ``fx_dose_delivered`` (None dersom en av dosene mangler)."""
+    npr: object
+    fractions: List[object]
+    dose_diff: Optional[float]
+
+
+@dataclass
+class PlanReconciliation:
+    plan_uid: str
+    matched: List[FractionMatch] = field(default_factory=list)
+    npr_only: List[object] = field(default_factory=list)
+    rtrecord_only: List[object] = field(default_factory=list)
+
+    @property
+    def delivered_source(self) -> str:
+        """Foreslått verdi for ``plan_delivered_source``: RT Record dersom den finnes, ellers NPR."""
+        if self.matched or self.rtrecord_only:
+            return "RTRECORD"
+        return "NPR" if self.npr_only else ""
+
+
+def _dose_diff(npr, fractions: List) -> Optional[float]:
+    given = parse_decimal(_get(npr, "GittDose"))
+    delivered = [_get(fraction, "fx_dose_delivered") for fraction in fractions]
+    if given is None or any(dose is None for dose in delivered):
+        return None
+    return given - sum(delivered)
+
+
+def _gap(npr, fx_time) -> timedelta:
+    """Avstand fra ``fx_time`` til kontaktens intervall [InnDato, UtDato] (0 inne i intervallet)."""
+    start, end = _get(npr, "InnDato"), _get(npr, "UtDato")
+    if fx_time < start:
+        return start - fx_time
+    if fx_time > end:
+        return fx_time - end
+    return timedelta(0)
+
+
+def reconcile_plan(plan_uid: str, npr_rows: List, fractions: List, tolerance: timedelta) -> PlanReconciliation:
+    """Kobler NPR-kontakter mot RT Record-fraksjoner for én plan med et intervallsøk i tid.
+
+    En kontakt dekker en fraksjon dersom ``fx_datetime`` ligger i [InnDato - tolerance, UtDato + tolerance].
+    Hver fraksjon kobles til den dekkende kontakten som ligger nærmest i tid (inne i intervallet før
+    avstand til endepunktene), slik at overlappende toleransevinduer ikke gir feil kobling. En kontakt kan
+    få flere fraksjoner; kontakter uten fraksjoner er NPR-only og fraksjoner uten kontakt RTRECORD-only.
+
+    Kontaktene sorteres på start og holdes i en haug på slutttidspunkt mens fraksjonene gjennomløpes i
+    tidsrekkefølge, så bare aktive kontakter vurderes for hver fraksjon."""
+    result = PlanReconciliation(plan_uid)
+    npr_rows = sorted(npr_rows, key=lambda r: _get(r, "InnDato"))
+    fractions = sorted(
+        (f for f in fractions if _get(f, "fx_datetime") is not None),
+        key=lambda f: _get(f, "fx_datetime")
+    )
+    assigned: Dict[int, List] = defaultdict(list)
+    active: List = []
+    i = 0
+    for fraction in fractions:
+        fx_time = _get(fraction, "fx_datetime")
+        while i < len(npr_rows) and _get(npr_rows[i], "InnDato") - tolerance <= fx_time:
+            heapq.heappush(active, (_get(npr_rows[i], "UtDato"), i))
+            i += 1
+        # Kontakter som slutter før vinduet kan ikke dekke senere fraksjoner heller
+        while active and active[0][0] + tolerance < fx_time:
+            heapq.heappop(active)
+        if not active:
+            result.rtrecord_only.append(fraction)
+            continue
+        best = min(active, key=lambda item: (_gap(npr_rows[item[1]], fx_time), item[1]))[1]
+        assigned[best].append(fraction)
+
+    for index, npr in enumerate(npr_rows):
+        if index in assigned:
+            result.matched.append(FractionMatch(npr, assigned[index], _dose_diff(npr, assigned[index])))
+        else:
+            result.npr_only.append(npr)
+    return result
+
+
+def reconcile(npr_rows: Iterable, fractions: Iterable, tolerance: timedelta = timedelta(minutes=30)) -> Dict[str, PlanReconciliation]:
+    """Avstemming av ``NPR.NPR`` mot ``RT.Fraction``, partisjonert på plan UID (``PlanUID`` / ``fx_plan_uid``).
+
+    Hver plan sorteres og søkes for seg, så kostnaden er O(n log n) i antall rader.
+    Fraksjoner uten tidspunkt regnes som RT Record-only."""
+    npr_by_plan = defaultdict(list)
+    for row in npr_rows:
+        npr_by_plan[_get(row, "PlanUID")].append(row)
+    fx_by_plan = defaultdict(list)
+    for row in fractions:
+        fx_by_plan[_get(row, "fx_plan_uid")].append(row)
+
+    results = {}
+    for plan_uid in npr_by_plan.keys() | fx_by_plan.keys():
+        plan_fractions = fx_by_plan.get(plan_uid, [])
+        result = reconcile_plan(plan_uid, npr_by_plan.get(plan_uid, []), plan_fractions, tolerance)
+        result.rtrecord_only.extend(f for f in plan_fractions if _get(f, "fx_datetime") is None)
+        results[plan_uid] = result
+    return results
+
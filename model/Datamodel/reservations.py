@@ -0,0 +1,79 @@
+from datetime import datetime
+from typing import Callable, Dict, Iterable, Optional, Set, Tuple
+
+
+def parse_reserved(value) -> bool:
+    """Tolker et (dekryptert) ``is_reserved``-svar fra Pvk som sannhetsverdi."""
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ("1", "true", "sann", "ja", "yes")
+
+
+class ReservationIndex:
+    """Gjeldende reservasjonsstatus per pasient
+       ========================================
+
+        Materialisert oversikt over siste PvkEvent (``event_time``) for hver ``fk_patient_key``.
+        Nye PvkSync-instanser legges inn inkrementelt med ``apply_sync``, og ``new_reservations`` /
+        ``new_reservation_removals`` telles opp underveis. Oppslag mot reserverte pasienter er et
+        mengdeoppslag, slik at filtrering av utleveringer ikke krever skann av hele Pvk-historikken.
+
+        ``decrypt`` benyttes på ``is_reserved_aes`` før tolkning. Standard er å lese verdien som den er."""
+
+    def __init__(self, decrypt: Optional[Callable[[str], str]] = None):
+        self.decrypt = decrypt or (lambda value: value)
+        self.latest: Dict[int, Tuple[datetime, bool]] = {}
+        self.reserved: Set[int] = set()
+
+    def apply_event(self, event) -> Optional[bool]:
+        """Legger inn én PvkEvent. Returnerer ny status dersom den endret seg, ellers ``None``."""
+        key = event.fk_patient_key
+        is_reserved = parse_reserved(self.decrypt(event.is_reserved_aes))
+        current = self.latest.get(key)
+        if current is not None and current[0] >= event.event_time:
+            return None
+
+        self.latest[key] = (event.event_time, is_reserved)
+        was_reserved = current is not None and current[1]
+        if is_reserved == was_reserved:
+            return None
+        if is_reserved:
+            self.reserved.add(key)
+        else:
+            self.reserved.discard(key)
+        return is_reserved
+
+    def apply_events(self, events: Iterable) -> Tuple[int, int]:
+        """Legger inn en samling PvkEvents og returnerer (nye reservasjoner, nye fjernede reservasjoner)."""
+        added = removed = 0
+        for event in sorted(events, key=lambda e: e.event_time):
+            changed = self.apply_event(event)
+            if changed is True:
+                added += 1
+            elif changed is False:
+                removed += 1
+        return added, removed
+
+    def apply_sync(self, pvk_sync):
+        """Legger inn alle ``pvk_events`` fra en PvkSync og oppdaterer tellerne på synkroniseringen."""
+        added, removed = self.apply_events(pvk_sync.pvk_events)
+        pvk_sync.new_reservations = added
+        pvk_sync.new_reservation_removals = removed
+        return pvk_sync
+
+    def is_reserved(self, patient_key: int) -> bool:
+        return patient_key in self.reserved
+
+    def filter_unreserved(self, rows: Iterable, key: str = "fk_patient_key"):
+        """Slipper kun gjennom rader for pasienter som ikke er reservert."""
+        reserved = self.reserved
+        for row in rows:
+            value = row[key] if isinstance(row, dict) else getattr(row, key)
+            if value not in reserved:
+                yield row
+
+    def __contains__(self, patient_key: int) -> bool:
+        return patient_key in self.reserved
+
+    def __len__(self) -> int:
+        return len(self.latest)
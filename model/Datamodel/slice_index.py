@@ -0,0 +1,106 @@
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+# Antall punkt-kant-par som testes per blokk i ``contains``
+CHUNK = 1 << 22
+
+
+class SliceIndex:
+    """Snittindeks for én struktur
+       ===========================
+
+        Bygger på de flate ``roi_coords_{x,y,z}_mm_nested``-vektorene og ``roi_coords_offsets_nested`` uten å
+        kopiere koordinatene (numpy-arrays brukes direkte, f.eks. fra Parquet/Arrow). Konturene sorteres på z,
+        slik at oppslag på et snitt er et binærsøk, og hver kontur er et utsnitt (view) av de flate vektorene.
+
+        ``contains`` tester hvilke punkter som ligger inne i strukturen med even-odd-regelen (indre konturer
+        er hull), vektorisert over alle punkter og kanter i snittet."""
+
+    def __init__(self, x, y, z, offsets):
+        self.x = np.asarray(x, dtype=float)
+        self.y = np.asarray(y, dtype=float)
+        self.z = np.asarray(z, dtype=float)
+        self.starts = np.asarray(offsets, dtype=np.int64)
+        self.ends = np.append(self.starts[1:], len(self.x)) if len(self.starts) else self.starts
+        contour_z = self.z[self.starts] if len(self.starts) else np.zeros(0)
+        self.order = np.argsort(contour_z, kind="stable")
+        self.sorted_z = contour_z[self.order]
+        self.levels = np.unique(self.sorted_z)
+        self.thickness = float(np.median(np.diff(self.levels))) if len(self.levels) > 1 else 0.0
+
+    @classmethod
+    def from_plan(cls, plan, index: int) -> "SliceIndex":
+        return cls(
+            plan.roi_coords_x_mm_nested[index], plan.roi_coords_y_mm_nested[index],
+            plan.roi_coords_z_mm_nested[index], plan.roi_coords_offsets_nested[index]
+        )
+
+    def __len__(self):
+        return len(self.starts)
+
+    def contour(self, i: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Kontur ``i`` (i opprinnelig rekkefølge) som views av x/y."""
+        return self.x[self.starts[i]:self.ends[i]], self.y[self.starts[i]:self.ends[i]]
+
+    def nearest_level(self, z, tolerance: Optional[float] = None) -> np.ndarray:
+        """Indeks i ``levels`` for nærmeste snitt, -1 dersom avstanden er større enn ``tolerance``
+        (standard: halv snittavstand)."""
+        z = np.asarray(z, dtype=float)
+        if not len(self.levels):
+            return np.full(z.shape, -1, dtype=np.int64)
+        tolerance = self.thickness / 2 + 1e-6 if tolerance is None else tolerance
+        position = np.searchsorted(self.levels, z)
+        below = np.clip(position - 1, 0, len(self.levels) - 1)
+        above = np.clip(position, 0, len(self.levels) - 1)
+        nearest = np.where(np.abs(self.levels[below] - z) <= np.abs(self.levels[above] - z), below, above)
+        return np.where(np.abs(self.levels[nearest] - z) <= tolerance, nearest, -1)
+
+    def _contour_range(self, level: int) -> Tuple[int, int]:
+        value = self.levels[level]
+        return int(np.searchsorted(self.sorted_z, value, "left")), int(np.searchsorted(self.sorted_z, value, "right"))
+
+    def contours_at(self, z: float, tolerance: Optional[float] = None) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """Konturene i snittet nærmest ``z`` (tom liste utenfor strukturen)."""
+        level = int(self.nearest_level(z, tolerance))
+        if level < 0:
+            return []
+        lo, hi = self._contour_range(level)
+        return [self.contour(i) for i in self.order[lo:hi]]
+
+    def _level_edges(self, level: int):
+        lo, hi = self._contour_range(level)
+        x1, y1, x2, y2 = [], [], [], []
+        for i in self.order[lo:hi]:
+            cx, cy = self.contour(i)
+            if len(cx):
+                x1.append(cx)
+                y1.append(cy)
+                x2.append(np.roll(cx, -1))
+                y2.append(np.roll(cy, -1))
+        if not x1:
+            return None
+        return tuple(np.concatenate(v) for v in (x1, y1, x2, y2))
+
+    def contains(self, points: np.ndarray, tolerance: Optional[float] = None) -> np.ndarray:
+        """Sann for punkter (N, 3) i mm som ligger inne i en kontur i nærmeste snitt."""
+        points = np.asarray(points, dtype=float).reshape(-1, 3)
+        inside = np.zeros(len(points), dtype=bool)
+        level = self.nearest_level(points[:, 2], tolerance)
+        for value in np.unique(level[level >= 0]):
+            edges = self._level_edges(int(value))
+            if edges is None:
+                continue
+            x1, y1, x2, y2 = edges
+            selected = np.flatnonzero(level == value)
+            step = max(CHUNK // len(x1), 1)
+            for start in range(0, len(selected), step):
+                chunk = selected[start:start + step]
+                px, py = points[chunk, 0:1], points[chunk, 1:2]
+                # Stråle mot +x: kanten krysser dersom py ligger mellom endepunktene og skjæringen er til høyre
+                straddles = (y1 > py) != (y2 > py)
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    xc = x1 + (py - y1) * (x2 - x1) / (y2 - y1)
+                crossings = np.count_nonzero(straddles & (px < xc), axis=1)
+                inside[chunk] = crossings % 2 == 1
+        return inside
@@ -0,0 +1,128 @@
+from collections import defaultdict
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from .Kodeliste import Course, Patient, Registry
+from .graph import GraphLoader
+
+STATUS_TYPES = ("epj_status", "dicom_status", "prom_status")
+
+
+def registry_for_course(loader: GraphLoader) -> Callable[[int], Optional[str]]:
+    """Gir oppslag fra ``fk_course_id`` til registernavn via Course -> Patient -> Registry i ``loader``."""
+    def lookup(course_id: int) -> Optional[str]:
+        course = loader.get(Course, course_id)
+        if course is None:
+            return None
+        patient = loader.get(Patient, course.fk_patient_key)
+        if patient is None:
+            return None
+        registry = loader.get(Registry, patient.fk_registry_id)
+        return registry.name if registry is not None else None
+    return lookup
+
+
+class StatusAggregate:
+    """Aggregerte datastatuser per register og HF
+       ==========================================
+
+        Holder antall behandlingsforløp per (register, HF, statustype, statuskode) for ``epj_status``,
+        ``dicom_status`` og ``prom_status``. Hver endring i en DataStatus-rad oppdaterer tellerne i O(1),
+        slik at dashboards kan lese et øyeblikksbilde uten å koble Course -> Patient -> Registry på nytt.
+
+        ``registry_of`` slår opp registernavn fra ``fk_course_id``, f.eks. ``registry_for_course(loader)``, og
+        ``hf_of`` tilsvarende HF (f.eks. ``Admin.sent_organisation`` for forløpet). Rader der registeret ikke
+        kan slås opp telles ikke med, men holdes i ``unresolved`` til ``retry_unresolved`` finner registeret."""
+
+    def __init__(self, registry_of: Callable[[int], Optional[str]], hf_of: Optional[Callable[[int], Optional[str]]] = None):
+        self.registry_of = registry_of
+        self.hf_of = hf_of or (lambda course_id: None)
+        self.counts: Dict[str, Dict[Optional[str], Dict[str, Dict[int, int]]]] = defaultdict(
+            lambda: defaultdict(lambda: defaultdict(lambda: defaultdict(int)))
+        )
+        self._current: Dict[int, Tuple[Tuple[str, Optional[str]], Tuple[int, int, int]]] = {}
+        self.unresolved: Dict[int, object] = {}
+
+    def _add(self, group: Tuple[str, Optional[str]], codes: Tuple[int, int, int], delta: int):
+        registry, hf = group
+        per_hf = self.counts[registry][hf]
+        for status_type, code in zip(STATUS_TYPES, codes):
+            per_type = per_hf[status_type]
+            per_type[code] += delta
+            if not per_type[code]:
+                del per_type[code]
+
+    def update(self, status, registry: Optional[str] = None, hf: Optional[str] = None):
+        """Legger inn eller oppdaterer en DataStatus-rad."""
+        if registry is None:
+            registry = self.registry_of(status.fk_course_id)
+        if registry is None:
+            self.remove(status.id)
+            self.unresolved[status.id] = status
+            return
+        self.unresolved.pop(status.id, None)
+        if hf is None:
+            hf = self.hf_of(status.fk_course_id)
+        group = (registry, hf)
+        codes = tuple(getattr(status, status_type) for status_type in STATUS_TYPES)
+        previous = self._current.get(status.id)
+        if previous == (group, codes):
+            return
+        if previous is not None:
+            self._add(previous[0], previous[1], -1)
+        self._add(group, codes, 1)
+        self._current[status.id] = (group, codes)
+
+    def update_many(self, statuses: Iterable):
+        for status in statuses:
+            self.update(status)
+
+    def retry_unresolved(self) -> int:
+        """Prøver oppslaget på nytt for rader uten register (f.eks. etter at nye Course/Patient er lastet inn).
+        Returnerer antall rader som fortsatt mangler register."""
+        for status in list(self.unresolved.values()):
+            self.update(status)
+        return len(self.unresolved)
+
+    def remove(self, status_id: int):
+        self.unresolved.pop(status_id, None)
+        previous = self._current.pop(status_id, None)
+        if previous is not None:
+            self._add(previous[0], previous[1], -1)
+
+    def count(self, registry: Optional[str] = None, status_type: Optional[str] = None, code: Optional[int] = None,
+              hf: Optional[str] = None) -> int:
+        """Antall forløp som matcher filtrene. Utelatt register eller HF summeres over. ``code`` krever
+        ``status_type``, siden kodene ikke er felles for statustypene."""
+        if code is not None and status_type is None:
+            raise ValueError("code krever status_type")
+        # Hvert forløp telles én gang per statustype, så uten statustype holder det å summere én av dem
+        status_type = status_type or STATUS_TYPES[0]
+        registries = [registry] if registry is not None else list(self.counts)
+        total = 0
+        for reg in registries:
+            per_registry = self.counts.get(reg, {})
+            for hf_name in ([hf] if hf is not None else list(per_registry)):
+                per_type = per_registry.get(hf_name, {}).get(status_type, {})
+                total += per_type.get(code, 0) if code is not None else sum(per_type.values())
+        return total
+
+    def snapshot(self, registry: Optional[str] = None, by_hf: bool = False) -> Dict:
+        """Kopi av tellerne, enten for ett register eller alle: {register: {statustype: {kode: antall}}},
+        eller med ``by_hf`` {register: {HF: {statustype: {kode: antall}}}}."""
+        registries = [registry] if registry is not None else list(self.counts)
+        out = {}
+        for reg in registries:
+            per_registry = self.counts.get(reg, {})
+            if by_hf:
+                out[reg] = {
+                    hf: {st: dict(per_type) for st, per_type in per_hf.items()}
+                    for hf, per_hf in per_registry.items()
+                }
+                continue
+            merged: Dict[str, Dict[int, int]] = defaultdict(lambda: defaultdict(int))
+            for per_hf in per_registry.values():
+                for st, per_type in per_hf.items():
+                    for code, n in per_type.items():
+                        merged[st][code] += n
+            out[reg] = {st: dict(per_type) for st, per_type in merged.items()}
+        return out
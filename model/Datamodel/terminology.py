@@ -0,0 +1,194 @@
+import csv
+import os
+import re
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Type
+
+import numpy as np
+from pydantic import BaseModel
+from pydantic.fields import FieldInfo
+
+FINNKODE = re.compile(r"FinnKode\s*(\d+)")
+KODEVERK = re.compile(r"\*\*Kodeverk:\*\*\s*(.+?)\s*$", re.MULTILINE)
+
+# Felt som er knyttet til et kodeverk, men som inneholder visningsverdien (navnet) og ikke koden
+DISPLAY_FIELDS = ("RegionNavn",)
+
+# Skilletegn når kodelisten har én kolonne, og ``csv.Sniffer`` ikke kan avgjøre det
+DEFAULT_DELIMITER = ";"
+
+
+def code_value(value) -> Optional[str]:
+    """Koden i en verdi: tekst som den er, ``.v`` for ``EPJ.Code``/``EPJ.CodeValueBoth`` (ev. som dict)."""
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, dict):
+        return value.get("v", value.get("Kode"))
+    if hasattr(value, "v"):
+        return value.v
+    raise TypeError(f"Kan ikke lese kode fra {type(value).__name__}")
+
+
+def normalise_code(code: str) -> str:
+    """Felles normalisering: store bokstaver, uten punktum og mellomrom (C34.1 -> C341)."""
+    return code.strip().upper().replace(".", "").replace(" ", "")
+
+
+def terminology_key(name: str) -> str:
+    """Kortnavn for et kodeverk, f.eks. "Norsk klinisk prosedyrekodeverk (FinnKode 7275)" -> "FinnKode 7275"."""
+    match = FINNKODE.search(name)
+    return f"FinnKode {match.group(1)}" if match else name.strip()
+
+
+def field_terminology(field: FieldInfo) -> Optional[str]:
+    """Kodeverket et felt er knyttet til, enten fra ``terminology`` (NPR) eller fra beskrivelsen (``field_with_meta``)."""
+    extra = field.json_schema_extra if isinstance(field.json_schema_extra, dict) else {}
+    if extra.get("terminology"):
+        return extra["terminology"]
+    match = KODEVERK.search(field.description or "")
+    return match.group(1) if match else None
+
+
+class CodeList:
+    """Kodeliste for ett kodeverk
+       ==========================
+
+        Kodene ligger sortert i et numpy-array (med visningsverdiene i samme rekkefølge) og slås opp med
+        binærsøk. ``prefix`` og ``between`` gir områdesøk, f.eks. for ICD10-kapitler (``between("C00", "D49")``).
+        ``resolve_column`` slår opp alle unike verdier i en kolonne med ett vektorisert ``searchsorted``, og
+        ``display`` har en LRU-cache for oppslag rad for rad. Verdier kan være tekst eller ``EPJ.Code``."""
+
+    def __init__(self, name: str, entries: Iterable[Tuple[str, str]],
+                 normalise: Callable[[str], str] = normalise_code, cache_size: int = 4096):
+        self.name = name
+        self.normalise = normalise
+        merged = {}
+        for code, display in entries:
+            merged[normalise(code)] = display
+        codes = sorted(merged)
+        self.codes = np.array(codes, dtype=str)
+        self.displays = np.array([merged[code] for code in codes], dtype=object)
+        self._by_display = {str(display).strip().casefold(): code for code, display in merged.items() if display}
+        self.display = lru_cache(maxsize=cache_size)(self._display)
+
+    @classmethod
+    def from_file(cls, path: str, name: Optional[str] = None, encoding: str = "utf-8-sig", **kwargs) -> "CodeList":
+        """Leser en lokal kodeliste (CSV/TSV med kode og visningsverdi i de to første kolonnene)."""
+        with open(path, newline="", encoding=encoding) as f:
+            sample = f.read(4096)
+            f.seek(0)
+            try:
+                delimiter = csv.Sniffer().sniff(sample, delimiters=";,\t|").delimiter
+            except csv.Error:
+                # F.eks. en kodeliste med bare én kolonne
+                delimiter = "\t" if path.lower().endswith(".tsv") else DEFAULT_DELIMITER
+            reader = csv.reader(f, delimiter=delimiter)
+            rows = [row for row in reader if row and row[0].strip()]
+        if rows and rows[0][0].strip().lower() in ("kode", "code", "verdi", "value"):
+            rows = rows[1:]
+        name = name or os.path.splitext(os.path.basename(path))[0]
+        return cls(name, ((row[0], row[1] if len(row) > 1 else "") for row in rows), **kwargs)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def _index(self, code: str) -> int:
+        i = int(np.searchsorted(self.codes, code))
+        return i if i < len(self.codes) and self.codes[i] == code else -1
+
+    def _display(self, code) -> Optional[str]:
+        code = code_value(code)
+        if not code:
+            return None
+        i = self._index(self.normalise(code))
+        return self.displays[i] if i >= 0 else None
+
+    def __contains__(self, code) -> bool:
+        code = code_value(code)
+        return bool(code) and self._index(self.normalise(code)) >= 0
+
+    def _slice(self, lo: str, hi: str) -> List[Tuple[str, str]]:
+        i, j = np.searchsorted(self.codes, [lo, hi])
+        return list(zip(self.codes[i:j].tolist(), self.displays[i:j].tolist()))
+
+    def prefix(self, prefix: str) -> List[Tuple[str, str]]:
+        """Alle koder som starter med ``prefix``, f.eks. "C34"."""
+        prefix = self.normalise(prefix)
+        return self._slice(prefix, prefix + "\uffff")
+
+    def between(self, start: str, end: str) -> List[Tuple[str, str]]:
+        """Alle koder fra og med ``start`` til (men ikke med) ``end``, f.eks. et ICD10-kapittel."""
+        return self._slice(self.normalise(start), self.normalise(end))
+
+    def resolve_column(self, values: Sequence) -> List[Optional[str]]:
+        """Visningsverdi for hver verdi i kolonnen (``None`` for ukjente/manglende koder)."""
+        normalised = [self.normalise(c) if c else None for c in map(code_value, values)]
+        uniques = sorted({v for v in normalised if v})
+        found: Dict[str, Optional[str]] = {}
+        if uniques and len(self.codes):
+            positions = np.minimum(np.searchsorted(self.codes, uniques), len(self.codes) - 1)
+            hits = self.codes[positions] == np.array(uniques, dtype=str)
+            found = {code: self.displays[p] if hit else None for code, p, hit in zip(uniques, positions.tolist(), hits.tolist())}
+        return [found.get(v) if v else None for v in normalised]
+
+    def validate_column(self, values: Sequence) -> List[bool]:
+        """Sann for verdier som finnes i kodelisten. Manglende verdier regnes som gyldige."""
+        return [not code_value(v) or d is not None for v, d in zip(values, self.resolve_column(values))]
+
+    def codes_for_displays(self, names: Sequence[Optional[str]]) -> List[Optional[str]]:
+        """Kode for hver visningsverdi (navn), uten hensyn til store/små bokstaver. Brukes for ``DISPLAY_FIELDS``."""
+        return [self._by_display.get(name.strip().casefold()) if name else None for name in names]
+
+
+class TerminologyService:
+    """Lokal terminologitjeneste
+       =========================
+
+        Samler kodelister for ICD10, MedDRA, CTCAE, FinnKode m.fl., lest fra lokale filer uten nettverkstilgang.
+        Kodeverket for et felt hentes fra ``terminology``-metadata i modellen."""
+
+    def __init__(self, code_lists: Iterable[CodeList] = ()):
+        self.code_lists: Dict[str, CodeList] = {}
+        for code_list in code_lists:
+            self.add(code_list)
+
+    def add(self, code_list: CodeList):
+        self.code_lists[terminology_key(code_list.name)] = code_list
+
+    @classmethod
+    def from_directory(cls, directory: str) -> "TerminologyService":
+        """Leser alle .csv/.tsv/.txt-filer i ``directory``. Filnavnet angir kodeverket (f.eks. "ICD10.csv", "FinnKode 8406.csv")."""
+        lists = [
+            CodeList.from_file(os.path.join(directory, name))
+            for name in sorted(os.listdir(directory))
+            if name.lower().endswith((".csv", ".tsv", ".txt"))
+        ]
+        return cls(lists)
+
+    def get(self, terminology: str) -> Optional[CodeList]:
+        return self.code_lists.get(terminology_key(terminology))
+
+    def for_field(self, model: Type[BaseModel], field: str) -> Optional[CodeList]:
+        terminology = field_terminology(model.model_fields[field])
+        return self.get(terminology) if terminology else None
+
+    def _required(self, model: Type[BaseModel], field: str) -> CodeList:
+        code_list = self.for_field(model, field)
+        if code_list is None:
+            raise KeyError(f"Ingen kodeliste lastet for {model.__name__}.{field}")
+        return code_list
+
+    def validate_column(self, model: Type[BaseModel], field: str, values: Sequence) -> List[bool]:
+        """Validerer en hel kolonne for ``model.field`` mot kodeverket feltet er knyttet til. For felt i
+        ``DISPLAY_FIELDS`` (f.eks. ``RegionNavn``) sjekkes navnet mot visningsverdiene."""
+        code_list = self._required(model, field)
+        if field in DISPLAY_FIELDS:
+            return [not v or c is not None for v, c in zip(values, code_list.codes_for_displays(values))]
+        return code_list.validate_column(values)
+
+    def resolve_column(self, model: Type[BaseModel], field: str, values: Sequence) -> List[Optional[str]]:
+        """Visningsverdi for hver kode i kolonnen. For felt i ``DISPLAY_FIELDS`` gis koden for navnet."""
+        code_list = self._required(model, field)
+        if field in DISPLAY_FIELDS:
+            return code_list.codes_for_displays(values)
+        return code_list.resolve_column(values)
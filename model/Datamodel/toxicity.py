@@ -0,0 +1,137 @@
+from dataclasses import dataclass
+from typing import Dict, Iterable, Optional, Sequence, Tuple
+
+import numpy as np
+
+BASELINE_TRUE = ("1", "true", "ja", "j", "yes", "y")
+DAY = np.timedelta64(1, "D")
+
+
+@dataclass(frozen=True)
+class ToxWindow:
+    """Halvåpent tidsvindu [start, slutt) for verste grad, angitt i dager relativt til første (``first``)
+    eller siste (``last``) fraksjon. ``end_days=None`` betyr åpent vindu."""
+    name: str
+    start_ref: str
+    start_days: int
+    end_ref: str
+    end_days: Optional[int]
+
+
+# Akutt: fra første fraksjon til 90 dager etter siste. Sen: deretter.
+DEFAULT_WINDOWS = (
+    ToxWindow("acute", "first", 0, "last", 90),
+    ToxWindow("late", "last", 90, "last", None),
+)
+
+
+def _get(row, name):
+    return row.get(name) if isinstance(row, dict) else getattr(row, name)
+
+
+def _code(value) -> Optional[str]:
+    if value is None:
+        return None
+    return value.get("v") if isinstance(value, dict) else value.v
+
+
+def _grade(value) -> int:
+    code = _code(value)
+    try:
+        return int(str(code).strip())
+    except (TypeError, ValueError):
+        return -1
+
+
+def _datetimes(values) -> np.ndarray:
+    return np.array([np.datetime64(v, "s") if v is not None else np.datetime64("NaT") for v in values], dtype="datetime64[s]")
+
+
+def adverse_columns(rows: Iterable) -> Dict[str, np.ndarray]:
+    """Kolonner fra ``EPJ.Adverse``: record_id, CTCAE-term, grad (-1 ukjent), dato og baseline-flagg."""
+    rows = list(rows)
+    return {
+        "record_id": np.array([_get(r, "record_id") or "" for r in rows], dtype=str),
+        "term": np.array([_code(_get(r, "ae_term")) or "" for r in rows], dtype=str),
+        "grade": np.array([_grade(_get(r, "ae_grade")) for r in rows], dtype=np.int16),
+        "date": _datetimes([_get(r, "ae_added_dt") for r in rows]),
+        "baseline": np.array([str(_code(_get(r, "ae_is_baseline")) or "").strip().lower() in BASELINE_TRUE for r in rows], dtype=bool),
+    }
+
+
+def treatment_columns(rows: Iterable) -> Dict[str, np.ndarray]:
+    """Første og siste fraksjon per pasient fra ``EPJ.TreatmentRT`` (min/maks over alle stråleserier)."""
+    rows = list(rows)
+    record_id = np.array([_get(r, "record_id") or "" for r in rows], dtype=str)
+    first = _datetimes([_get(r, "txrt_first_fx_dt") for r in rows])
+    last = _datetimes([_get(r, "txrt_last_fx_dt") for r in rows])
+
+    patients, inverse = np.unique(record_id, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    big = np.datetime64("9999-12-31T00:00:00")
+    small = np.datetime64("0001-01-01T00:00:00")
+    first_fx = np.full(len(patients), big)
+    last_fx = np.full(len(patients), small)
+    np.minimum.at(first_fx, inverse, np.where(np.isnat(first), big, first))
+    np.maximum.at(last_fx, inverse, np.where(np.isnat(last), small, last))
+    first_fx[first_fx == big] = np.datetime64("NaT")
+    last_fx[last_fx == small] = np.datetime64("NaT")
+    return {"record_id": patients, "first_fx": first_fx, "last_fx": last_fx}
+
+
+def toxicity_endpoints(
+        adverse: Dict[str, np.ndarray],
+        treatment: Dict[str, np.ndarray],
+        windows: Sequence[ToxWindow] = DEFAULT_WINDOWS,
+        thresholds: Tuple[int, ...] = (2, 3)
+    ) -> Dict[str, np.ndarray]:
+    """Toksisitetsendepunkter per (pasient, CTCAE-term)
+
+    Beregner baseline-grad, verste grad i hvert tidsvindu og dager fra første fraksjon til første
+    ikke-baseline registrering med grad >= terskel, med grupperte numpy-operasjoner over alle pasienter.
+    Grad -1 betyr ingen registrering, og NaN betyr at terskelen ikke er nådd."""
+
+    # Gruppenummer for (pasient, term): sortert som tekstparet, og første forekomst gir verdiene ut
+    patients, patient_index = np.unique(adverse["record_id"], return_inverse=True)
+    terms, term_index = np.unique(adverse["term"], return_inverse=True)
+    pairs = patient_index.reshape(-1).astype(np.int64) * len(terms) + term_index.reshape(-1)
+    _, first, inverse = np.unique(pairs, return_index=True, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    n = len(first)
+    out = {"record_id": adverse["record_id"][first], "term": adverse["term"][first]}
+
+    # Koble hver registrering mot pasientens første/siste fraksjon (NaT uten strålebehandling)
+    nat = np.datetime64("NaT", "s")
+    refs = {"first": np.full(len(pairs), nat), "last": np.full(len(pairs), nat)}
+    if len(treatment["record_id"]):
+        position = np.searchsorted(treatment["record_id"], adverse["record_id"])
+        position = np.minimum(position, len(treatment["record_id"]) - 1)
+        has_rt = treatment["record_id"][position] == adverse["record_id"]
+        refs["first"] = np.where(has_rt, treatment["first_fx"][position], nat)
+        refs["last"] = np.where(has_rt, treatment["last_fx"][position], nat)
+
+    grade, date, baseline = adverse["grade"], adverse["date"], adverse["baseline"]
+
+    baseline_grade = np.full(n, -1, dtype=np.int16)
+    np.maximum.at(baseline_grade, inverse[baseline], grade[baseline])
+    out["baseline_grade"] = baseline_grade
+
+    followup = ~baseline
+    for window in windows:
+        start = refs[window.start_ref] + np.timedelta64(window.start_days, "D")
+        mask = followup & (date >= start)
+        if window.end_days is not None:
+            mask &= date < refs[window.end_ref] + np.timedelta64(window.end_days, "D")
+        worst = np.full(n, -1, dtype=np.int16)
+        np.maximum.at(worst, inverse[mask], grade[mask])
+        out[f"worst_grade_{window.name}"] = worst
+
+    days = (date - refs["first"]) / DAY
+    for threshold in thresholds:
+        mask = followup & (grade >= threshold) & (days >= 0)
+        first_days = np.full(n, np.inf)
+        np.minimum.at(first_days, inverse[mask], days[mask])
+        first_days[np.isinf(first_days)] = np.nan
+        out[f"days_to_grade{threshold}"] = first_days
+
+    return out
@@ -0,0 +1,103 @@
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+
+AXES = ("gantry", "collimator", "couch")
+ROT_DIRS = np.array(["NONE", "CW", "CC"])
+
+# Rotasjonsretningen (DICOM) som gir økende vinkel, per akse (IEC 61217). DICOM angir retningen sett fra
+# isosenter mot gantry (300A,011F), fra strålekilden (300A,0121) og ovenfra mot bordet (300A,0123). Gantryvinkelen
+# øker med klokken sett fra isosenter, mens kollimator- og bordvinkelen øker mot klokken sett fra kilden/ovenfra.
+INCREASING = {"gantry": "CW", "collimator": "CC", "couch": "CC"}
+
+
+def angle_steps(
+        angles: np.ndarray,
+        counts: np.ndarray,
+        direction: Optional[Sequence[str]] = None,
+        increasing: str = "CW"
+    ) -> np.ndarray:
+    """Vinkelendring fra forrige kontrollpunkt (0 for første kontrollpunkt i hvert felt)
+
+    Uten ``direction`` velges korteste vei rundt 360°. Med DICOM-rotasjonsretning per felt ("CW"/"CC"/"NONE")
+    følger endringen den angitte retningen, slik at også steg på 180° eller mer blir riktige. ``increasing`` er
+    retningen som gir økende vinkel for aksen (se ``INCREASING``)."""
+    angles = np.asarray(angles, dtype=float)
+    diff = np.diff(angles, prepend=angles[:1] if len(angles) else angles)
+    steps = (diff + 180) % 360 - 180
+    if direction is not None:
+        decreasing = "CC" if increasing == "CW" else "CW"
+        direction = np.repeat(np.asarray(direction, dtype=str), counts)
+        steps = np.where(direction == increasing, diff % 360, steps)
+        steps = np.where(direction == decreasing, -(-diff % 360), steps)
+        steps = np.where(direction == "NONE", 0.0, steps)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    steps[starts[counts > 0]] = 0.0
+    return steps
+
+
+def summarise(
+        angles: np.ndarray,
+        counts: Sequence[int],
+        prefix: str = "gantry",
+        direction: Optional[Sequence[str]] = None,
+        tolerance: float = 1e-3
+    ) -> Dict[str, np.ndarray]:
+    """Start, slutt, rotasjonsretning, utstrekning, min og maks for én akse i en bunke felt
+
+    Vinklene for alle felt ligger etter hverandre, og ``counts`` angir antall kontrollpunkter per felt.
+    ``min`` og ``max`` er minste og største vinkel (0-360°), som i ``RT.Beam``. Banen pakkes i tillegg ut over
+    360°, slik at en bue 181° -> 179° med klokken har ``range`` 358°; sektoren buen dekker gis som
+    ``{prefix}_arc_from`` og ``{prefix}_arc_to`` (fra -> til i retning økende vinkel, her 181° og 179°).
+    Nøklene for ``RT.Beam`` har samme navn som feltene der (``{prefix}_start`` osv.); ``arc_*`` er ekstra."""
+
+    counts = np.asarray(counts, dtype=np.int64)
+    n = len(counts)
+    angles = np.asarray(angles, dtype=float) % 360
+    increasing = INCREASING.get(prefix, "CW")
+    steps = angle_steps(angles, counts, direction, increasing)
+    group = np.repeat(np.arange(n), counts)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    has = counts > 0
+    ends = np.maximum(starts + counts - 1, 0)
+
+    names = ("start", "end", "range", "min", "max", "arc_from", "arc_to")
+    out = {f"{prefix}_{name}": np.full(n, np.nan) for name in names}
+    rot_dir = np.full(n, "NONE", dtype=ROT_DIRS.dtype)
+    if len(angles):
+        # Utpakket bane: startvinkel pluss kumulativ endring innenfor feltet
+        travelled = np.cumsum(steps)
+        first = np.minimum(starts, len(angles) - 1)
+        unwrapped = (angles[first] - travelled[first])[group] + travelled
+        lowest = np.minimum.reduceat(unwrapped, starts[has])
+        highest = np.maximum.reduceat(unwrapped, starts[has])
+        net = np.bincount(group, weights=steps, minlength=n)
+
+        out[f"{prefix}_start"][has] = angles[starts[has]]
+        out[f"{prefix}_end"][has] = angles[ends[has]]
+        out[f"{prefix}_range"][has] = np.bincount(group, weights=np.abs(steps), minlength=n)[has]
+        out[f"{prefix}_min"][has] = np.minimum.reduceat(angles, starts[has])
+        out[f"{prefix}_max"][has] = np.maximum.reduceat(angles, starts[has])
+        out[f"{prefix}_arc_from"][has] = lowest % 360
+        out[f"{prefix}_arc_to"][has] = highest % 360
+        labels = np.array(["NONE", increasing, "CC" if increasing == "CW" else "CW"])
+        rot_dir[has] = labels[np.where(net[has] > tolerance, 1, np.where(net[has] < -tolerance, 2, 0))]
+    out[f"{prefix}_rot_dir"] = rot_dir
+    return out
+
+
+def trajectory_fields(
+        counts: Sequence[int],
+        gantry: Optional[np.ndarray] = None,
+        collimator: Optional[np.ndarray] = None,
+        couch: Optional[np.ndarray] = None,
+        directions: Optional[Dict[str, Sequence[str]]] = None
+    ) -> Dict[str, np.ndarray]:
+    """``gantry_*``, ``collimator_*`` og ``couch_*`` for en hel bunke felt. ``directions`` kan gi DICOM-
+    rotasjonsretning per felt og akse, f.eks. ``{"gantry": ["CW", "CC", ...]}``."""
+    directions = directions or {}
+    out: Dict[str, np.ndarray] = {}
+    for prefix, angles in zip(AXES, (gantry, collimator, couch)):
+        if angles is not None:
+            out.update(summarise(angles, counts, prefix, directions.get(prefix)))
+    return out
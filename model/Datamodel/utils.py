@@ -1,8 +1,9 @@
+import hashlib
 from typing_extensions import Annotated
 
 from pydantic import BaseModel, PlainSerializer, BeforeValidator, Field
 from typing import Optional, List, Literal
-from datetime import datetime
+from datetime import datetime, date
 
 
 def field_with_meta(
@@ -36,4 +37,34 @@ def field_with_meta(
 	if not default_factory:
 		return Field(default=default, alias=title, description=description_added, hidden=hidden)
 	else:
-		return Field(default_factory=default_factory, alias=title, description=description_added, hidden=hidden)
\ No newline at end of file
+		return Field(default_factory=default_factory, alias=title, description=description_added, hidden=hidden)
+
+
+def parse_decimal(value):
+	"""Tolker tall med desimalkomma (f.eks. "1,8" fra NPR) som float. Tom verdi gir None."""
+	if value is None:
+		return None
+	if isinstance(value, (int, float)):
+		return float(value)
+	value = value.strip().replace(",", ".")
+	return float(value) if value else None
+
+
+def normalise_value(value) -> str:
+	"""Stabil tekstrepresentasjon av en feltverdi, til bruk i innholdshasher."""
+	if value is None:
+		return ""
+	if isinstance(value, (datetime, date)):
+		return value.isoformat()
+	if isinstance(value, BaseModel):
+		return "|".join(normalise_value(v) for v in value.model_dump().values())
+	return str(value).strip()
+
+
+def content_digest(values) -> bytes:
+	"""128-bits innholdshash av en sekvens av feltverdier."""
+	h = hashlib.blake2b(digest_size=16)
+	for value in values:
+		h.update(normalise_value(value).encode("utf-8"))
+		h.update(b"\x1f")
+	return h.digest()
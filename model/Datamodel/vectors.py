@@ -0,0 +1,51 @@
+from typing import Iterable, Tuple
+
+import numpy as np
+
+from .RT import vector3_parser
+
+
+def vector_array(rows: Iterable, field: str) -> np.ndarray:
+    """(N, 3)-array for et ``Vector3``-felt (``DVH.centroid``, ``Beam.isocenter``).
+    Manglende verdier blir NaN. Rader kan være modeller (allerede tolket) eller dicts med legacy-tekst."""
+    out = []
+    for row in rows:
+        value = row.get(field) if isinstance(row, dict) else getattr(row, field)
+        out.append((np.nan,) * 3 if value is None else vector3_parser(value))
+    return np.array(out, dtype=float).reshape(-1, 3)
+
+
+def to_arrow(vectors: np.ndarray):
+    """Kolonne med fast listelengde 3 (``fixed_size_list<double>[3]``), null der vektoren mangler."""
+    import pyarrow as pa
+
+    vectors = np.asarray(vectors, dtype=float).reshape(-1, 3)
+    missing = np.isnan(vectors).any(axis=1)
+    values = pa.array(np.nan_to_num(vectors).ravel(), type=pa.float64())
+    return pa.FixedSizeListArray.from_arrays(values, 3, mask=pa.array(missing) if missing.any() else None)
+
+
+def from_arrow(column) -> np.ndarray:
+    """(N, 3)-array fra en ``fixed_size_list``-kolonne uten tolking av tekst; null blir NaN."""
+    import pyarrow as pa
+
+    if isinstance(column, pa.ChunkedArray):
+        column = column.combine_chunks()
+    vectors = column.flatten().to_numpy(zero_copy_only=False).reshape(-1, 3).astype(float)
+    if column.null_count:
+        # flatten() hopper over null-elementer; bygg opp på nytt med NaN
+        out = np.full((len(column), 3), np.nan)
+        out[~column.is_null().to_numpy(zero_copy_only=False)] = vectors
+        return out
+    return vectors
+
+
+def centroid_dist_to_iso(centroids: np.ndarray, isocenters: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """``centroid_dist_to_iso_min``/``_max``: minste og største avstand fra hver sentroide (N, 3) til
+    isosentrene (M, 3) i samme plan."""
+    centroids = np.asarray(centroids, dtype=float).reshape(-1, 3)
+    isocenters = np.asarray(isocenters, dtype=float).reshape(-1, 3)
+    distances = np.linalg.norm(centroids[:, None, :] - isocenters[None, :, :], axis=2)
+    if not isocenters.size:
+        return np.full(len(centroids), np.nan), np.full(len(centroids), np.nan)
+    return np.nanmin(distances, axis=1), np.nanmax(distances, axis=1)
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Pakken ``Datamodel`` ligger under model/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "model"))
@@ -0,0 +1,28 @@
+import os
+
+import numpy as np
+import pytest
+
+from Datamodel.dvh_calc import DoseGrid, calculate_dvhs, geom_calc_secs
+from test_rasterise import GRID, plan, square
+
+
+def segments():
+    return {name for name in os.listdir("/dev/shm") if name.startswith("psm_")} if os.path.isdir("/dev/shm") else set()
+
+
+def test_dvhs_per_structure_and_dose_grid():
+    p = plan([("Lunge", "ORGAN", square(4)), ("Lunge", "ORGAN", square(4, shift=8))])
+    flat = DoseGrid(np.full(GRID.shape, 2.0, dtype=np.float32), GRID)
+    ramp = DoseGrid(np.fromfunction(lambda k, j, i: j * 0.1, GRID.shape, dtype=np.float32), GRID)
+    before = segments()
+
+    out = list(calculate_dvhs([(p, flat), (p, ramp)], workers=2, prefetch=1))
+
+    assert segments() <= before
+    (flat_plan, flat_results), (ramp_plan, ramp_results) = out
+    assert [max(r.doses_gy) for r in flat_results] == pytest.approx([2.05, 2.05])
+    # Strukturer med samme navn har hver sin maske
+    assert max(ramp_results[0].doses_gy) < max(ramp_results[1].doses_gy)
+    assert flat_plan.dose_calc_sec == [r.dose_calc_sec for r in flat_results]
+    assert all(t is not None for t in geom_calc_secs(ramp_plan, ramp_results))
@@ -0,0 +1,25 @@
+from datetime import datetime
+
+import pytest
+
+from Datamodel.fraction_tracker import FractionTracker
+
+
+def fraction(number, dose, day):
+    return {"fx_plan_uid": "1.2.3", "fx_number": number, "fx_dose_delivered": dose, "fx_datetime": datetime(2024, 1, day, 8)}
+
+
+def test_plan_completion_after_out_of_order_add_before_flush():
+    tracker = FractionTracker()
+    tracker.set_planned("1.2.3", fx_dose_planned=0.1, total_dose_planned=1.0)
+    tracker.add(fraction(1, 0.1, 1))
+    tracker.add(fraction(3, 0.3, 3))
+    tracker.flush()
+
+    tracker.add(fraction(2, 0.3, 2))
+    assert tracker.plan_completion("1.2.3") == pytest.approx(0.7)
+    assert tracker.cumulative_dose("1.2.3", 3) == pytest.approx(0.7)
+
+    fractions, plans = tracker.flush()
+    assert [f.fx_number for f in fractions] == [2, 3]
+    assert plans[0].plan_completion == pytest.approx(0.7)
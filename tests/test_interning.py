@@ -0,0 +1,32 @@
+import pytest
+from pydantic import ValidationError
+
+from Datamodel.EPJ import Clinic, Code, CodeValue
+from Datamodel.interning import interning
+
+
+def test_codes_stay_mutable_without_interning():
+    code = Code.model_validate({"Kode": "1"})
+    code.v = "2"
+    assert code.v == "2"
+
+
+def test_equal_values_share_one_frozen_instance():
+    with interning() as cache:
+        a = CodeValue.model_validate({"Målt verdi": "60", "Enhet": "kg"})
+        b = CodeValue.model_validate({"Målt verdi": 60.0, "Enhet": "kg"})
+        c = CodeValue.model_validate({"Målt verdi": 61, "Enhet": "kg"})
+    assert a is b and a is not c
+    assert isinstance(a, CodeValue) and cache.hits == 1
+    with pytest.raises(ValidationError):
+        a.magnitude = 70.0
+
+
+def test_shared_instances_serialise_like_the_model():
+    row = {"Pasientnøkkel i NORPREG": "a", "Kroppsvekt ved diagnose": {"Målt verdi": 70, "Enhet": "kg"}}
+    plain = Clinic.model_validate(row)
+    with interning():
+        shared = Clinic.model_validate(row)
+    assert shared.cln_weight.magnitude == 70.0
+    assert shared.model_dump() == plain.model_dump()
+    assert shared.model_dump_json() == plain.model_dump_json()
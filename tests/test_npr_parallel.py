@@ -0,0 +1,37 @@
+import os
+
+import pytest
+
+from Datamodel.npr_columnar import NPRColumns
+from Datamodel.npr_parallel import parallel_transform
+
+
+def batch(series, doses):
+    return NPRColumns.from_strings({
+        "BehSerieId": series,
+        "GittDose": doses,
+        "InnDato": ["2024-03-04 09:00:00"] * len(series),
+        "UtDato": ["2024-03-04 09:10:00"] * len(series),
+    })
+
+
+def fail(columns):
+    raise ValueError("ugyldig batch")
+
+
+def segments():
+    return {name for name in os.listdir("/dev/shm") if name.startswith("psm_")} if os.path.isdir("/dev/shm") else set()
+
+
+def test_summaries_are_merged_across_batches():
+    before = segments()
+    rows = parallel_transform([batch(["A", "B"], ["2,0", "2,0"]), batch(["A"], ["1,8"])], workers=2)
+    assert [row["BehSerieId"] for row in rows] == ["A", "B"]
+    assert segments() <= before
+
+
+def test_errors_propagate_and_segments_are_removed():
+    before = segments()
+    with pytest.raises(ValueError):
+        parallel_transform([batch(["A", "B"], ["2,0", "2,0"]), batch(["C"], ["2,0"])], transform=fail, workers=2)
+    assert segments() <= before
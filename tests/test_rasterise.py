@@ -0,0 +1,43 @@
+from Datamodel.Strukturer import Plan
+from Datamodel.rasterise import Grid, MaskStore, ptv_overlap
+
+GRID = Grid((-20.0, -20.0, -20.0), (2.0, 2.0, 2.0), (21, 21, 21))
+
+
+def square(size, shift=0.0):
+    x, y, z, offsets = [], [], [], []
+    for level in range(-10, 11, 2):
+        offsets.append(len(x))
+        x += [-size, size, size, -size]
+        y += [-size + shift, -size + shift, size + shift, size + shift]
+        z += [float(level)] * 4
+    return x, y, z, offsets
+
+
+def plan(structures):
+    values = {
+        "hf": None, "pseudo_key": None, "plan_year": None, "plan_uid": "1.2.3", "plan_name": None,
+        "structure_names": [name for name, _, _ in structures],
+        "structure_types": [kind for _, kind, _ in structures],
+        "structure_volumes": [], "dose_calc_sec": [], "dvh_relative_volumes_nested": [], "dvh_doses_gy_nested": [],
+        "roi_coords_x_mm_nested": [c[0] for _, _, c in structures],
+        "roi_coords_y_mm_nested": [c[1] for _, _, c in structures],
+        "roi_coords_z_mm_nested": [c[2] for _, _, c in structures],
+        "roi_coords_offsets_nested": [c[3] for _, _, c in structures],
+    }
+    return Plan.model_validate({Plan.model_fields[k].alias: v for k, v in values.items()})
+
+
+def test_structures_with_the_same_name_keep_separate_masks(tmp_path):
+    p = plan([("PTV", "PTV", square(6)), ("Lunge", "ORGAN", square(4)), ("Lunge", "ORGAN", square(4, shift=8))])
+    first = MaskStore(str(tmp_path)).plan_masks(p, GRID)
+    assert first[1].volume_cc != first[1].intersection_cc(first[2])
+
+    # Nytt lager leser maskene fra disk
+    again = MaskStore(str(tmp_path)).plan_masks(p, GRID)
+    assert [m.volume_cc for m in again] == [m.volume_cc for m in first]
+    assert again[2].intersection_cc(first[2]) == first[2].volume_cc
+
+    overlap = ptv_overlap(p, GRID, MaskStore(str(tmp_path)))
+    assert [row["roi_name"] for row in overlap] == ["PTV", "Lunge", "Lunge"]
+    assert overlap[1]["ptv_overlap"] > overlap[2]["ptv_overlap"]
@@ -0,0 +1,38 @@
+from datetime import datetime, timedelta
+
+from Datamodel.reconciliation import reconcile
+
+
+def contact(start, end, kno, dose="2,0"):
+    day = datetime(2024, 3, 4)
+    return {"PlanUID": "1.2", "Kno": kno, "GittDose": dose,
+            "InnDato": day.replace(hour=start[0], minute=start[1]), "UtDato": day.replace(hour=end[0], minute=end[1])}
+
+
+def fx(hour, minute, dose=2.0):
+    return {"fx_plan_uid": "1.2", "fx_datetime": datetime(2024, 3, 4, hour, minute), "fx_dose_delivered": dose}
+
+
+def test_overlapping_windows_pick_the_covering_contact():
+    # Fraksjonen 09:25 hører til kontakten 09:20-09:30, ikke 09:00-09:10
+    result = reconcile([contact((9, 0), (9, 10), "A"), contact((9, 20), (9, 30), "B")], [fx(9, 25)])["1.2"]
+    assert [m.npr["Kno"] for m in result.matched] == ["B"]
+    assert [r["Kno"] for r in result.npr_only] == ["A"]
+    assert not result.rtrecord_only
+
+
+def test_several_fractions_in_one_contact():
+    result = reconcile([contact((9, 0), (9, 30), "A", "4,0")], [fx(9, 5), fx(9, 20)])["1.2"]
+    assert len(result.matched) == 1 and len(result.matched[0].fractions) == 2
+    assert result.matched[0].dose_diff == 0
+    assert not result.rtrecord_only and not result.npr_only
+
+
+def test_outside_tolerance_on_both_sides():
+    result = reconcile([contact((9, 0), (9, 10), "A")], [fx(8, 0), fx(11, 0)], timedelta(minutes=30))["1.2"]
+    assert len(result.rtrecord_only) == 2 and len(result.npr_only) == 1
+
+
+def test_fraction_without_time_is_rtrecord_only():
+    result = reconcile([], [{"fx_plan_uid": "1.2", "fx_datetime": None, "fx_dose_delivered": 2.0}])["1.2"]
+    assert len(result.rtrecord_only) == 1 and not result.matched
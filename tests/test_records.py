@@ -0,0 +1,31 @@
+from datetime import datetime
+
+import pytest
+
+from Datamodel.EPJ import Adverse
+from Datamodel.RT import DICOM, Beam, Fraction
+from Datamodel.records import dump_records, to_records
+
+DUMP_OPTIONS = ({}, {"by_alias": True}, {"exclude_none": True}, {"mode": "json"}, {"mode": "json", "by_alias": True})
+
+INSTANCES = [
+    Beam.model_validate({"Isocenter position": [1.0, 2.5, -3.0], "Gantry start [deg]": 181.0}),
+    # DICOMDate-serialisereren forventer DICOM-formatet (YYYYMMDD) i feltet
+    DICOM.model_construct(series_date="20240131", files_nb=12),
+    Fraction.model_validate({"Fraction number": 3, "Fraction datetime": datetime(2024, 1, 8, 8), "Fraction dose (delivered) [Gy]": 2.0}),
+    Adverse.model_validate({"Adverse ID": "1", "Term for bivirkning": {"Kode": "10013950", "Vist verdi": "Dysphagia"}, "Dato for bivirkningsregistrering": datetime(2024, 2, 1)}),
+]
+
+
+@pytest.mark.parametrize("instance", INSTANCES, ids=lambda i: type(i).__name__)
+@pytest.mark.parametrize("options", DUMP_OPTIONS, ids=str)
+def test_record_dump_matches_model_dump(instance, options):
+    record, = to_records(type(instance), [instance])
+    assert record.model_dump(**options) == instance.model_dump(**options)
+    assert dump_records([record], **options) == [instance.model_dump(**options)]
+
+
+def test_record_round_trip():
+    instance = INSTANCES[0]
+    record, = to_records(Beam, [instance])
+    assert record.to_model().model_dump() == instance.model_dump()
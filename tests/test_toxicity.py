@@ -0,0 +1,38 @@
+from datetime import datetime
+
+import numpy as np
+
+from Datamodel.toxicity import adverse_columns, toxicity_endpoints, treatment_columns
+
+
+def adverse(record_id, term, grade, day, baseline="nei"):
+    return {
+        "record_id": record_id, "ae_term": {"v": term}, "ae_grade": {"v": str(grade)},
+        "ae_added_dt": datetime(2024, 1, day), "ae_is_baseline": {"v": baseline},
+    }
+
+
+TREATMENT = treatment_columns([
+    {"record_id": "p1", "txrt_first_fx_dt": datetime(2024, 1, 1), "txrt_last_fx_dt": datetime(2024, 1, 10)},
+])
+
+
+def test_no_adverse_events():
+    out = toxicity_endpoints(adverse_columns([]), TREATMENT)
+    assert all(len(values) == 0 for values in out.values())
+    assert {"record_id", "term", "baseline_grade", "worst_grade_acute", "days_to_grade2"} <= set(out)
+
+
+def test_grouped_per_patient_and_term():
+    out = toxicity_endpoints(adverse_columns([
+        adverse("p1", "Dysphagia", 1, 1, baseline="ja"),
+        adverse("p1", "Dysphagia", 3, 6),
+        adverse("p1", "Fatigue", 2, 3),
+        adverse("p2", "Dysphagia", 2, 4),
+    ]), TREATMENT)
+    assert out["record_id"].tolist() == ["p1", "p1", "p2"]
+    assert out["term"].tolist() == ["Dysphagia", "Fatigue", "Dysphagia"]
+    assert out["baseline_grade"].tolist() == [1, -1, -1]
+    assert out["worst_grade_acute"].tolist() == [3, 2, -1]
+    assert out["days_to_grade2"][:2].tolist() == [5.0, 2.0]
+    assert np.isnan(out["days_to_grade2"][2])